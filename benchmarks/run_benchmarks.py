@@ -0,0 +1,254 @@
+"""
+Benchmarks for the simpy_helpers hot paths.
+
+Runs a set of standard models at several scales and reports, for each one:
+- simulated events / second and entities / second
+- peak memory (tracemalloc, measured in a second run so it doesn't slow down the timed one)
+- how long each Stats query takes afterwards
+
+Results are written as JSON so runs on different commits can be compared:
+
+    python benchmarks/run_benchmarks.py                      # writes benchmarks/results/<commit>.json
+    python benchmarks/run_benchmarks.py --scales 1000 --scenarios mm1 tandem
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import numpy as np
+import simpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simpy_helpers import Entity, Resource, Container, Source, Stats
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+class CountingEnvironment(simpy.Environment):
+    """
+    simpy Environment that counts every event it schedules
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events_scheduled = 0
+
+    def schedule(self, *args, **kwargs):
+        self.events_scheduled += 1
+        super().schedule(*args, **kwargs)
+
+# Models. Entities find their resources through attributes, so nothing depends on module level globals.
+
+class Customer(Entity):
+    def process(self):
+        for resource in self.attributes["route"]:
+            yield self.wait_for_resource(resource)
+            yield self.process_at_resource(resource)
+            self.release_resource(resource)
+
+class PriorityCustomer(Customer):
+    priority = 0
+
+class Server(Resource):
+    def service_time(self, entity):
+        return np.random.exponential(self.mean_service_time)
+
+class Station1(Server):
+    pass
+
+class Station2(Server):
+    pass
+
+class Station3(Server):
+    pass
+
+class CustomerSource(Source):
+    def __init__(self, env, route, mean_interarrival_time, number, priority_fraction=0):
+        super().__init__(env, number=number)
+        self.route = route
+        self.mean_interarrival_time = mean_interarrival_time
+        self.priority_fraction = priority_fraction
+
+    def interarrival_time(self):
+        return np.random.exponential(self.mean_interarrival_time)
+
+    def build_entity(self):
+        attributes = { "route": self.route, "segment": np.random.choice(["a", "b", "c"]) }
+        if self.priority_fraction and np.random.random() < self.priority_fraction:
+            return PriorityCustomer(self.env, attributes)
+        return Customer(self.env, attributes)
+
+class Car(Entity):
+    def process(self):
+        tank = self.attributes["tank"]
+        if tank.level < self.attributes["amount"]:
+            tank.put(tank.capacity - tank.level)
+        tank.get(self.attributes["amount"])
+        yield self.wait()
+
+class Tank(Container):
+    pass
+
+class CarSource(Source):
+    def __init__(self, env, tank, number):
+        super().__init__(env, number=number)
+        self.tank = tank
+
+    def interarrival_time(self):
+        return np.random.exponential(1)
+
+    def build_entity(self):
+        return Car(self.env, { "tank": self.tank, "amount": np.random.choice([1, 5, 10, 20]) })
+
+def _server(resource_class, env, capacity, mean_service_time):
+    server = resource_class(env, capacity=capacity)
+    server.mean_service_time = mean_service_time
+    return server
+
+def build_mm1(env, number):
+    server = _server(Station1, env, 1, 0.8)
+    env.process(CustomerSource(env, [server], 1, number).start())
+    return [server], []
+
+def build_mmc_priority(env, number):
+    server = _server(Station1, env, 4, 3.6)
+    env.process(CustomerSource(env, [server], 1, number, priority_fraction=0.2).start())
+    return [server], []
+
+def build_tandem(env, number):
+    stations = [_server(station, env, 2, 1.7) for station in (Station1, Station2, Station3)]
+    env.process(CustomerSource(env, stations, 1, number).start())
+    return stations, []
+
+def build_container(env, number):
+    tank = Tank(env, 200, init=200)
+    env.process(CarSource(env, tank, number).start())
+    return [], [tank]
+
+SCENARIOS = {
+    "mm1": build_mm1,
+    "mmc_priority": build_mmc_priority,
+    "tandem": build_tandem,
+    "container": build_container
+}
+
+def _time(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def _query_timings(resources, containers):
+    queries = {
+        "get_total_times": lambda: Stats.get_total_times(),
+        "get_waiting_times": lambda: Stats.get_waiting_times(),
+        "get_processing_times": lambda: Stats.get_processing_times(),
+        "get_waiting_times[attributes]": lambda: Stats.get_waiting_times(attributes={ "segment": "a" }),
+    }
+    for resource in resources:
+        queries.update({
+            f"get_waiting_times[{resource.name}]": lambda resource=resource: Stats.get_waiting_times(resource),
+            f"get_total_times[{resource.name}]": lambda resource=resource: Stats.get_total_times(resource),
+            f"queue_size_over_time[{resource.name}, 1]": lambda resource=resource: Stats.queue_size_over_time(resource),
+            f"queue_size_over_time[{resource.name}, 0.01]": lambda resource=resource: Stats.queue_size_over_time(resource, 0.01),
+            f"utilization_over_time[{resource.name}, 0.1]": lambda resource=resource: Stats.utilization_over_time(resource, 0.1),
+            f"time_average_queue_length[{resource.name}]": lambda resource=resource: Stats.time_average_queue_length(resource),
+        })
+    for container in containers:
+        queries.update({
+            f"container_level_over_time[{container.name}, 0.1]": lambda container=container: Stats.container_level_over_time(container, 0.1),
+        })
+    return { name: _time(query) for name, query in queries.items() }
+
+def run_scenario(name, number, seed=42, measure_memory=True):
+    np.random.seed(seed)
+    env = CountingEnvironment()
+    resources, containers = SCENARIOS[name](env, number)
+    run_seconds = _time(env.run)
+    entities = len(Stats.get_entities())
+    result = {
+        "scenario": name,
+        "scale": number,
+        "run_seconds": run_seconds,
+        "events": env.events_scheduled,
+        "events_per_second": env.events_scheduled / run_seconds,
+        "entities": entities,
+        "entities_per_second": entities / run_seconds,
+        "queries": _query_timings(resources, containers)
+    }
+    if measure_memory:
+        # a second identical run, tracemalloc slows the simulation down too much to time it
+        np.random.seed(seed)
+        env = CountingEnvironment()
+        SCENARIOS[name](env, number)
+        tracemalloc.start()
+        env.run()
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return "unknown"
+
+def compare(baseline_path, candidate_path):
+    """
+    prints candidate / baseline ratios for each scenario and scale found in both files
+    """
+    with open(baseline_path) as f:
+        baseline = { (r["scenario"], r["scale"]): r for r in json.load(f)["results"] }
+    with open(candidate_path) as f:
+        candidate = { (r["scenario"], r["scale"]): r for r in json.load(f)["results"] }
+    print(f"{'scenario':<14} {'scale':>8} {'events/s':>10} {'entities/s':>10} {'memory':>8} {'queries':>8}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        memory = new.get("peak_memory_bytes", np.nan) / old.get("peak_memory_bytes", np.nan)
+        queries = sum(new["queries"].values()) / sum(old["queries"].values())
+        print(f"{key[0]:<14} {key[1]:>8} {new['events_per_second'] / old['events_per_second']:>10.2f}x "
+            f"{new['entities_per_second'] / old['entities_per_second']:>9.2f}x {memory:>7.2f}x {queries:>7.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--scales", nargs="+", type=int, default=DEFAULT_SCALES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory run")
+    parser.add_argument("--output", help="where to write the JSON results (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = _git_commit()
+    results = []
+    for scenario in args.scenarios:
+        for scale in args.scales:
+            result = run_scenario(scenario, scale, args.seed, not args.no_memory)
+            results.append(result)
+            print(f"{scenario:<14} {scale:>8} {result['run_seconds']:>8.2f}s {result['events_per_second']:>12,.0f} events/s "
+                f"{result['entities_per_second']:>10,.0f} entities/s {sum(result['queries'].values()):>8.3f}s queries")
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "simpy": simpy.__version__,
+            "seed": args.seed,
+            "results": results
+        }, f, indent=2)
+    print(f"results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ class Debug:
     """
     Use this class to add debug statements to simulation output
     Doesn't necessarily need to be used outside of this file... but could be
+    The simulation's own debug output goes through Trace, see Trace.py
     """
     DEBUG = False
     @staticmethod
@@ -1,41 +1,92 @@
-from .Debug import Debug
+from .Trace import Trace
+from .Profiler import Profiler
 from .Stats import Stats
 from collections import OrderedDict
 
+class Visit:
+    """
+    One visit of an entity to a resource.
+    request is the simpy request while the entity holds (or is queued for) the resource, None once released.
+    """
+    __slots__ = ("resource_name", "arrival_time", "start_service_time", "finish_service_time", "request")
+
+    def __init__(self, resource_name, arrival_time, request=None):
+        self.resource_name = resource_name
+        self.arrival_time = arrival_time
+        self.start_service_time = None
+        self.finish_service_time = None
+        self.request = request
+
 class Entity:
+    # entities are slotted to keep per entity memory low when millions are alive.
+    # Subclasses that don't define __slots__ still get a __dict__ for their own attributes.
+    __slots__ = ("env", "attributes", "creation_time", "disposal_time", "visits", "id", "name",
+        "total_time", "waiting_time", "processing_time", "__weakref__")
+
     # 0 has higher priority than 1. making 1 the default allows us to bump users to front of line
     DEFAULT_ENTITY_PRIORITY = 1
     @staticmethod
     def _empty_resource_tracking_dict():
         return { 'arrival_time': [], 'start_service_time': [], 'finish_service_time': [], 'request': None }
 
-    def __init__(self, env, attributes = {}):
+    def __init__(self, env, attributes = None):
         """
-        resources_requested - keeps track of all of the resources that were requested by this entity (in order of visitation)
+        visits - a Visit record for every resource request made by this entity (in order of visitation)
         attributes - a list of keys/values that apply to this entity (gender, age, etc...)
         creation_time - when the entity was created (initialized in constructor)
         disposal_time - when the entity was disposed of
+        waiting_time / processing_time - running totals over finished waits and services, kept up to date as the entity moves
+        total_time - set once the entity is disposed
         """
         if self.process is None:
              raise NotImplementedError("You must define a function called 'process' in your entity class")
         
-        self.attributes = attributes
+        self.attributes = attributes if attributes is not None else {}
 
         # Default priority for non-priority-entities is 0
         priority = Entity.DEFAULT_ENTITY_PRIORITY
         if "priority" in self.attributes:
             priority = self.attributes["priority"]
-        elif "priority" in dir(self.__class__):
+        elif hasattr(self.__class__, "priority"):
             priority = self.__class__.priority
         
         self.attributes["priority"] = priority
         self.env = env
         self.creation_time = None
         self.disposal_time = None # remember to dispose of entities after finishing processing!
+        self.total_time = None
+        self.waiting_time = 0
+        self.processing_time = 0
         self.attributes["disposed"] = False
-        self.resources_requested = OrderedDict()
+        self.visits = []
+        self.id = None # assigned when the entity is added to Stats
 
     
+    @property
+    def resources_requested(self):
+        """
+        The visits grouped by resource name, in the { 'arrival_time': [...], 'start_service_time': [...], ... } layout
+        entities used to store. Built on demand, changing it has no effect on the entity.
+        """
+        resources_requested = OrderedDict()
+        for visit in self.visits:
+            if visit.resource_name not in resources_requested:
+                resources_requested[visit.resource_name] = Entity._empty_resource_tracking_dict()
+            resource_dict = resources_requested[visit.resource_name]
+            resource_dict["arrival_time"].append(visit.arrival_time)
+            if visit.start_service_time is not None:
+                resource_dict["start_service_time"].append(visit.start_service_time)
+            if visit.finish_service_time is not None:
+                resource_dict["finish_service_time"].append(visit.finish_service_time)
+            resource_dict["request"] = visit.request
+        return resources_requested
+
+    def visited_resource_names(self):
+        """
+        names of the resources visited by this entity, in order of first visit
+        """
+        return list(OrderedDict.fromkeys(visit.resource_name for visit in self.visits))
+
     def __str__(self):
         return f"{self.name} created_at: {self.creation_time} attributes: {self.attributes}"
     
@@ -44,24 +95,30 @@ class Entity:
         Record arbitrary set of attributes about the entity.
         Could include things like gender, age, anything really.
         Resources might use attributes to determine how a particular entity is processed.
+        Always use this method (rather than changing self.attributes directly) so Stats queries see the change.
         """
+        Stats._set_entity_attribute(self, attribute_name, attribute_value)
         self.attributes[attribute_name] = attribute_value
 
     def get_total_time(self):
         """
         total time that the entity spent in the system (from creation to disposal)
-        only accessible once the entity has been disposed
+        for entities that haven't been disposed this is the time in system so far
         """
-        self._calculate_statistics()
-        return self.total_time
+        if self.is_disposed():
+            return self.total_time
+        # sources build the next entity ahead of its arrival, it hasn't spent any time in the system yet
+        return max(self.env.now - self.creation_time, 0)
     
     def get_total_waiting_time(self):
         """
         total time that the entity spent queued waiting for resources
-        only accessible wonce the entity has been disposed
+        for entities that haven't been disposed, a wait in progress counts up to now
         """
-        self._calculate_statistics()
-        return self.waiting_time
+        if self.is_disposed():
+            return self.waiting_time
+        return self.waiting_time + sum([self.env.now - visit.arrival_time for visit in self.visits
+            if visit.request is not None and visit.start_service_time is None])
 
     def get_waiting_time_for_resource(self, resource):
         """
@@ -72,9 +129,12 @@ class Entity:
     def get_total_processing_time(self):
         """
         total time that the entity spent being processed by resources
+        for entities that haven't been disposed, a service in progress counts up to now
         """
-        self._calculate_statistics()
-        return self.processing_time
+        if self.is_disposed():
+            return self.processing_time
+        return self.processing_time + sum([self.env.now - visit.start_service_time for visit in self.visits
+            if visit.request is not None and visit.start_service_time is not None])
 
 
     def get_processing_time_for_resource(self, resource):
@@ -88,53 +148,65 @@ class Entity:
         The time that a resource is requested
         should be logged as the "arrival time" for the resource.
         """
-        Debug.info(f'{self.name} requesting {resource.name}: {self.env.now}')
+        if Trace.ENABLED:
+            Trace.event(self.env.now, "request", self, resource)
 
         self._add_resource_to_visited(resource)
-        self.resources_requested[resource.name]["arrival_time"].append(self.env.now)
+        visit = Visit(resource.name, self.env.now)
+        self.visits.append(visit)
         priority = priority_override if priority_override is not None else self.attributes["priority"]
-        request = resource.request(priority=priority)
-        self.resources_requested[resource.name]['request'] = request
-        return request
+        visit.request = resource.request(priority=priority)
+        return visit.request
     
     def process_at_resource(self, resource):
-        Debug.info(f'{self.name} started processing at {resource.name} : {self.env.now}')        
-        self.resources_requested[resource.name]["start_service_time"].append(self.env.now)
+        if Trace.ENABLED:
+            Trace.event(self.env.now, "start", self, resource)
+        visit = self._last_visit(resource.name)
+        visit.start_service_time = self.env.now
+        self.waiting_time += visit.start_service_time - visit.arrival_time
         resource.add_resource_check()
         try: 
-            service_time = resource.service_time(self)
-        except TypeError:
-            # if students do not define a resource function that depends on entity
-            # still allow them to call it.
-            service_time = resource.service_time()
+            service_time = resource.next_service_time(self)
         except Exception:
             raise Exception(f"Error when calling {resource.name} service time function")
         return self.env.timeout(service_time)
 
     def release_resource(self, resource):
-        request = self.resources_requested[resource.name]['request']
-        if request is None:
-            Debug.info(f"resource has already been released by {self.name}")
+        visit = self._last_visit(resource.name)
+        if visit is None or visit.request is None:
+            if Trace.ENABLED:
+                Trace.event(self.env.now, "already_released", self, resource)
         else:
-            Debug.info(f'{self.name} finished at {resource.name}: {self.env.now}')
-            self.resources_requested[resource.name]["finish_service_time"].append(self.env.now)
-            resource.release(request)
-            self.resources_requested[resource.name]['request'] = None
+            if Trace.ENABLED:
+                Trace.event(self.env.now, "release", self, resource)
+            visit.finish_service_time = self.env.now
+            if visit.start_service_time is not None:
+                self.processing_time += visit.finish_service_time - visit.start_service_time
+            resource.release(visit.request)
+            visit.request = None
 
     def dispose(self):
         """
-        After an entity is finished being processed, it should be disposed
+        After an entity is finished being processed, it should be disposed.
+        Source disposes its entities when their process ends, disposing an entity again has no effect
         """
+        if self.attributes["disposed"]:
+            return self.disposal_time
         self.disposal_time = self.env.now
-        self.attributes["disposed"] = True
-        Debug.info(f"{self.name} disposed: {self.disposal_time}")
+        self.total_time = self.disposal_time - self.creation_time
+        self.set_attribute("disposed", True)
+        if Trace.ENABLED:
+            Trace.event(self.disposal_time, "dispose", self)
+        if Profiler.ENABLED:
+            Profiler.count(self.__class__.__name__, "disposed")
+        Stats._dispose_entity(self)
         return self.disposal_time
 
     def is_disposed(self):
         return self.attributes["disposed"]
     
     def did_visit_resource(self, resource_name):
-        return resource_name in self.resources_requested
+        return self._last_visit(resource_name) is not None
     
     def now(self):
         return self.env.now
@@ -142,73 +214,72 @@ class Entity:
     def wait(self, timeout=0):
         return self.env.timeout(timeout)
     
-    def _fill_in_for_non_disposed(self):
+    def _recycle(self, env, attributes=None, *args, **kwargs):
+        """
+        runs __init__ again on a disposed entity so a Source can reuse it, keeping its attributes dict and visits list
+        """
+        recycled_attributes = self.attributes
+        recycled_attributes.clear()
+        if attributes:
+            recycled_attributes.update(attributes)
+        visits = self.visits
+        visits.clear()
+        self.__init__(env, recycled_attributes, *args, **kwargs)
+        self.visits = visits
+
+    def _visit_times(self, visit):
         """
         Sometimes we might want to get statistics for entities that haven't been disposed
         Entities could be in several different places in simulation, they could be in queue
         they could have just been created without accessing any resources
         they could have just accessed one of N resources
         They could have been in the middle of processing at a resource
-        We want to fill in all of these potential scenarios with a heuristic of self.env.now
-        """
-        for name, resource_dict in self.resources_requested.items():
-            if resource_dict["request"] is not None:
-                # this means we are currently processing at the resource in some capacity and we should fill in the rest of our stats
-                # we can figure out what stage we are at by looking at the size of each array. If size does not match the arrival_time size
-                # then we should append self.env.now to the end of the list
-                arrival_size = len(resource_dict["arrival_time"])
-                start_size = len(resource_dict["start_service_time"])
-                finish_size = len(resource_dict["finish_service_time"])
-                
-                # it should only ever be one length different max.
-                if start_size < arrival_size:
-                    resource_dict["start_service_time"].append(self.env.now)
-                if finish_size < arrival_size:
-                    resource_dict["finish_service_time"].append(self.env.now)
-                
-            self.resources_requested[name] = resource_dict
-            
-        self.disposal_time = self.env.now
-                
-            
-        
-    
+        We fill in these scenarios with a heuristic of self.env.now, without changing the visit itself.
+        returns the (start_service_time, finish_service_time) to use for the visit.
+        """
+        start_service_time = visit.start_service_time
+        finish_service_time = visit.finish_service_time
+        if visit.request is not None and not self.is_disposed():
+            # this means we are currently queued or processing at the resource
+            if start_service_time is None:
+                start_service_time = self.env.now
+            if finish_service_time is None:
+                finish_service_time = self.env.now
+        return start_service_time, finish_service_time
+
     def _calculate_waiting_time_for_resource(self, resource_name):
         if not self.did_visit_resource(resource_name):
             return None
-        
-        if not self.is_disposed():
-            self._fill_in_for_non_disposed()
-            
-        resource_stats = self.resources_requested[resource_name]
-        return sum([start_time - arrival_time for start_time, arrival_time in zip(resource_stats["start_service_time"], resource_stats["arrival_time"])])
+        waiting_time = 0
+        for visit in self.visits:
+            if visit.resource_name == resource_name:
+                start_service_time, _ = self._visit_times(visit)
+                if start_service_time is not None:
+                    waiting_time += start_service_time - visit.arrival_time
+        return waiting_time
 
     def _calculate_processing_time_for_resource(self, resource_name):
         if not self.did_visit_resource(resource_name):
             return None
-        
-        if not self.is_disposed():
-            self._fill_in_for_non_disposed()
-        
-        resource_stats = self.resources_requested[resource_name]
-        return sum([finish_time - start_time for finish_time, start_time in zip(resource_stats["finish_service_time"], resource_stats["start_service_time"])])
-
-    def _calculate_statistics(self):
-        waiting_time = 0
         processing_time = 0
-        for resource_name, _ in self.resources_requested.items():
-            waiting_time += self._calculate_waiting_time_for_resource(resource_name)
-            processing_time += self._calculate_processing_time_for_resource(resource_name)
-
-        self.total_time = self.disposal_time - self.creation_time
-        self.waiting_time = waiting_time
-        self.processing_time = processing_time
+        for visit in self.visits:
+            if visit.resource_name == resource_name:
+                start_service_time, finish_service_time = self._visit_times(visit)
+                if start_service_time is not None and finish_service_time is not None:
+                    processing_time += finish_service_time - start_service_time
+        return processing_time
 
     def _add_resource_to_visited(self, resource):
         resource_name = resource.name
         Stats._add_resource(resource)
-        if not resource_name in self.resources_requested:
-            self.resources_requested[resource_name] = Entity._empty_resource_tracking_dict()
+        if not self.did_visit_resource(resource_name):
+            Stats._add_visit(self, resource_name)
+
+    def _last_visit(self, resource_name):
+        for visit in reversed(self.visits):
+            if visit.resource_name == resource_name:
+                return visit
+        return None
     
     def matches_attributes(self, attributes):
         for k, v in attributes.items():
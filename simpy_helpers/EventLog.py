@@ -0,0 +1,270 @@
+import numpy as np
+
+class EventLog:
+    """
+    Columnar log of (time, size, event) records captured by resources and containers.
+    Times and sizes are stored in growable typed arrays and the event kind is stored as a small integer code,
+    so no tuple or string is allocated per record.
+    Events other than the built in ones (e.g. add_resource_check(event="breakdown")) get the next free code on first use.
+    """
+    EVENT_CODES = {
+        "init": 0,
+        "request": 1,
+        "start": 2,
+        "release": 3,
+        "put": 4,
+        "get": 5
+    }
+    EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+    # codes are stored as int8
+    MAX_EVENT_CODE = 127
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, size_dtype=np.int64, capacity=INITIAL_CAPACITY):
+        self._times = np.empty(capacity, dtype=np.float64)
+        self._sizes = np.empty(capacity, dtype=size_dtype)
+        self._events = np.empty(capacity, dtype=np.int8)
+        self._length = 0
+
+    @staticmethod
+    def from_arrays(times, sizes, events):
+        """
+        builds a log holding a copy of already recorded columns (events as codes)
+        """
+        sizes = np.asarray(sizes)
+        log = EventLog(size_dtype=sizes.dtype, capacity=max(len(sizes), EventLog.INITIAL_CAPACITY))
+        log._times[:len(sizes)] = times
+        log._sizes[:len(sizes)] = sizes
+        log._events[:len(sizes)] = events
+        log._length = len(sizes)
+        return log
+
+    @staticmethod
+    def event_code(event):
+        code = EventLog.EVENT_CODES.get(event)
+        if code is None:
+            code = len(EventLog.EVENT_CODES)
+            if code > EventLog.MAX_EVENT_CODE:
+                raise Exception(f"Can't record more than {EventLog.MAX_EVENT_CODE + 1} different events, {event} is one too many")
+            EventLog.EVENT_CODES[event] = code
+            EventLog.EVENT_NAMES[code] = event
+        return code
+
+    @staticmethod
+    def register_event_names(event_names):
+        """
+        registers the { code: name } events of logs recorded elsewhere (a ResultStore or a snapshot), so their codes read back the same
+        """
+        for code, name in event_names.items():
+            code = int(code)
+            if EventLog.EVENT_CODES.get(name, code) != code or EventLog.EVENT_NAMES.get(code, name) != name:
+                raise Exception(f"The event {name} was recorded with code {code}, which is already used for another event")
+            EventLog.EVENT_CODES[name] = code
+            EventLog.EVENT_NAMES[code] = name
+
+    def append(self, time, size, event):
+        if self._length == len(self._times):
+            self._grow()
+        i = self._length
+        self._times[i] = time
+        self._sizes[i] = size
+        self._events[i] = EventLog.event_code(event)
+        self._length = i + 1
+
+    @property
+    def times(self):
+        """
+        zero-copy view of the recorded times.
+        Views are only valid until the next append grows the log, take a copy if you need to keep one around.
+        """
+        return self._times[:self._length]
+
+    @property
+    def sizes(self):
+        """
+        zero-copy view of the recorded sizes (queue length, number being processed or container level)
+        """
+        return self._sizes[:self._length]
+
+    @property
+    def events(self):
+        """
+        zero-copy view of the recorded event codes, see EventLog.EVENT_CODES
+        """
+        return self._events[:self._length]
+
+    def event_names(self):
+        return [EventLog.EVENT_NAMES[code] for code in self.events]
+
+    def nbytes(self):
+        return self.times.nbytes + self.sizes.nbytes + self.events.nbytes
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        # keeps the old list of (time, size, event) tuples interface working
+        for time, size, code in zip(self.times.tolist(), self.sizes.tolist(), self.events.tolist()):
+            yield time, size, EventLog.EVENT_NAMES[code]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # a list of (time, size, event) tuples, like slicing the old list did
+            return [(time, size, EventLog.EVENT_NAMES[code]) for time, size, code in
+                zip(self.times[index].tolist(), self.sizes[index].tolist(), self.events[index].tolist())]
+        return self.times[index].item(), self.sizes[index].item(), EventLog.EVENT_NAMES[int(self.events[index])]
+
+    # private
+
+    def _grow(self):
+        capacity = max(2 * len(self._times), EventLog.INITIAL_CAPACITY)
+        self._times = self._resize(self._times, capacity)
+        self._sizes = self._resize(self._sizes, capacity)
+        self._events = self._resize(self._events, capacity)
+
+    def _resize(self, array, capacity):
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[:self._length] = array[:self._length]
+        return grown
+
+class CoalescingEventLog(EventLog):
+    """
+    EventLog that keeps a single record per timestamp: a record at the same time as the last one replaces it.
+    Sampling only ever looks at the last record at a time, so the *_over_time results are unchanged.
+    """
+    @staticmethod
+    def event_code(event):
+        code = EventLog.EVENT_CODES.get(event)
+        if code is None:
+            code = len(EventLog.EVENT_CODES)
+            if code > EventLog.MAX_EVENT_CODE:
+                raise Exception(f"Can't record more than {EventLog.MAX_EVENT_CODE + 1} different events, {event} is one too many")
+            EventLog.EVENT_CODES[event] = code
+            EventLog.EVENT_NAMES[code] = event
+        return code
+
+    @staticmethod
+    def register_event_names(event_names):
+        """
+        registers the { code: name } events of logs recorded elsewhere (a ResultStore or a snapshot), so their codes read back the same
+        """
+        for code, name in event_names.items():
+            code = int(code)
+            if EventLog.EVENT_CODES.get(name, code) != code or EventLog.EVENT_NAMES.get(code, name) != name:
+                raise Exception(f"The event {name} was recorded with code {code}, which is already used for another event")
+            EventLog.EVENT_CODES[name] = code
+            EventLog.EVENT_NAMES[code] = name
+
+    def append(self, time, size, event):
+        i = self._length - 1
+        if i >= 0 and self._times[i] == time:
+            self._sizes[i] = size
+            self._events[i] = EventLog.event_code(event)
+            return
+        super().append(time, size, event)
+
+class DownsampledEventLog(EventLog):
+    """
+    EventLog keeping at most one record per bucket of resolution time units: the last record in the bucket,
+    plus the exact minimum and maximum the size reached during the bucket (see minimums / maximums).
+    With max_buckets, the resolution doubles (merging neighbouring buckets) whenever the log would grow past it,
+    so memory stays bounded however long the simulation runs.
+    """
+    def __init__(self, resolution, max_buckets=None, size_dtype=np.int64, capacity=EventLog.INITIAL_CAPACITY):
+        if not resolution > 0:
+            raise ValueError(f"resolution must be a positive number, got {resolution}")
+        if max_buckets is not None and max_buckets < 2:
+            raise ValueError(f"max_buckets must be at least 2, got {max_buckets}")
+        super().__init__(size_dtype, capacity)
+        self.resolution = float(resolution)
+        self.max_buckets = max_buckets
+        self._minimums = np.empty(capacity, dtype=size_dtype)
+        self._maximums = np.empty(capacity, dtype=size_dtype)
+        self._bucket = None
+
+    @staticmethod
+    def event_code(event):
+        code = EventLog.EVENT_CODES.get(event)
+        if code is None:
+            code = len(EventLog.EVENT_CODES)
+            if code > EventLog.MAX_EVENT_CODE:
+                raise Exception(f"Can't record more than {EventLog.MAX_EVENT_CODE + 1} different events, {event} is one too many")
+            EventLog.EVENT_CODES[event] = code
+            EventLog.EVENT_NAMES[code] = event
+        return code
+
+    @staticmethod
+    def register_event_names(event_names):
+        """
+        registers the { code: name } events of logs recorded elsewhere (a ResultStore or a snapshot), so their codes read back the same
+        """
+        for code, name in event_names.items():
+            code = int(code)
+            if EventLog.EVENT_CODES.get(name, code) != code or EventLog.EVENT_NAMES.get(code, name) != name:
+                raise Exception(f"The event {name} was recorded with code {code}, which is already used for another event")
+            EventLog.EVENT_CODES[name] = code
+            EventLog.EVENT_NAMES[code] = name
+
+    def append(self, time, size, event):
+        bucket = time // self.resolution
+        i = self._length - 1
+        if bucket == self._bucket:
+            self._times[i] = time
+            self._sizes[i] = size
+            self._events[i] = EventLog.event_code(event)
+            if size < self._minimums[i]:
+                self._minimums[i] = size
+            elif size > self._maximums[i]:
+                self._maximums[i] = size
+            return
+        if self.max_buckets is not None and self._length >= self.max_buckets:
+            self._coarsen()
+            self.append(time, size, event)
+            return
+        # the size carried over from the previous bucket holds until this record, unless it falls right on the bucket start
+        carried = self._sizes[i] if i >= 0 and time > bucket * self.resolution else size
+        super().append(time, size, event)
+        self._minimums[i + 1] = min(carried, size)
+        self._maximums[i + 1] = max(carried, size)
+        self._bucket = bucket
+
+    @property
+    def minimums(self):
+        """
+        smallest size during each record's bucket
+        """
+        return self._minimums[:self._length]
+
+    @property
+    def maximums(self):
+        """
+        largest size during each record's bucket
+        """
+        return self._maximums[:self._length]
+
+    def nbytes(self):
+        return super().nbytes() + self.minimums.nbytes + self.maximums.nbytes
+
+    # private
+
+    def _grow(self):
+        super()._grow()
+        self._minimums = self._resize(self._minimums, len(self._times))
+        self._maximums = self._resize(self._maximums, len(self._times))
+
+    def _coarsen(self):
+        while self._length >= self.max_buckets:
+            self.resolution *= 2
+            buckets = np.floor(self.times / self.resolution)
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            ends = np.r_[starts[1:], self._length] - 1
+            minimums = np.minimum.reduceat(self.minimums, starts)
+            maximums = np.maximum.reduceat(self.maximums, starts)
+            length = len(starts)
+            self._times[:length] = self._times[ends]
+            self._sizes[:length] = self._sizes[ends]
+            self._events[:length] = self._events[ends]
+            self._minimums[:length] = minimums
+            self._maximums[:length] = maximums
+            self._length = length
+        self._bucket = self._times[self._length - 1] // self.resolution
@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+import inspect
+import itertools
+from functools import partial
+from contextlib import nullcontext
+from .Stats import Stats
+from .Resource import Container
+from .Snapshot import StatsSnapshot
+from .OutputAnalysis import OutputAnalysis
+from .Replications import Replications, _simulate
+
+class Experiment:
+    """
+    Runs a model over a grid of parameters and seeds, caching the Stats of every (configuration, seed) cell on disk.
+
+    model_builder(env, seed, **params) - builds the model for one configuration, like the model_builder of Replications.
+        It may return the containers of the model so they're saved too (Stats only tracks the resources entities visit).
+    grid - { parameter: [values] } to run every combination, or a list of { parameter: value } configurations
+    cache_dir - where cached cells are kept, one StatsSnapshot file per cell
+    summarize(env) (optional) - metrics of one cell, called with the cell's cached Stats restored as the current summary.
+        Defaults to Replications.default_summary. Changing it never re-runs a simulation.
+    version (optional) - cells are keyed on a hash of their parameters, seed and version.
+        Defaults to a hash of the source code of the module model_builder is defined in, so editing the model
+        invalidates its cells. Parameters should be plain values (numbers, strings, ...) so their hash is stable.
+        In a notebook only model_builder itself is hashed, pass version= when the model classes live in other cells.
+
+        experiment = Experiment(build, { "capacity": [1, 2, 3], "arrival_rate": [0.5, 0.9] }, seeds=range(10),
+            run_length=1000, cache_dir="cache")
+        rows = experiment.run()                    # one dict per cell: parameters, seed and metrics
+        experiment.confidence_intervals()         # per configuration, pooled over seeds
+
+    workers and executor work like they do for Replications.
+    """
+    def __init__(self, model_builder, grid, seeds, run_length, cache_dir, summarize=None, version=None, workers=None, executor="process"):
+        if executor not in Replications.EXECUTORS:
+            raise NotImplementedError(f"You must pick an executor in the list {list(Replications.EXECUTORS)}")
+        self.model_builder = model_builder
+        self.configurations = Experiment.expand_grid(grid)
+        self.seeds = list(seeds)
+        self.run_length = run_length
+        self.cache_dir = cache_dir
+        self.summarize = summarize if summarize is not None else Replications.default_summary
+        self.version = version if version is not None else Experiment.code_version(model_builder)
+        self.workers = workers
+        self.executor = executor
+        self.results = []
+        self.cells_run = 0
+        self.cells_cached = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def expand_grid(grid):
+        if isinstance(grid, dict):
+            names = list(grid)
+            return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+        return [dict(configuration) for configuration in grid]
+
+    @staticmethod
+    def code_version(model_builder):
+        """
+        hash of the source of the module model_builder is defined in. When the module has no source file
+        (a notebook, python -c, ...) the source of model_builder itself is hashed, or failing that its bytecode
+        """
+        bound_arguments = ""
+        while isinstance(model_builder, partial):
+            bound_arguments += repr((model_builder.args, sorted(model_builder.keywords.items())))
+            model_builder = model_builder.func
+        try:
+            source = inspect.getsource(inspect.getmodule(model_builder))
+        except (TypeError, OSError):
+            try:
+                source = inspect.getsource(model_builder)
+            except (TypeError, OSError):
+                code = getattr(model_builder, "__code__", None)
+                if code is None:
+                    raise Exception(f"Can't tell which version of the model {model_builder!r} is, pass version= to the Experiment")
+                source = Experiment._code_description(code)
+        return hashlib.sha256((source + bound_arguments).encode()).hexdigest()[:16]
+
+    def cell_key(self, params, seed):
+        description = json.dumps({ "params": params, "seed": seed, "version": self.version, "snapshot_version": StatsSnapshot.VERSION },
+            sort_keys=True, default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def cell_path(self, params, seed):
+        return os.path.join(self.cache_dir, f"{self.cell_key(params, seed)}.pkl")
+
+    def run(self):
+        """
+        runs the cells that aren't cached yet, then summarizes every cell.
+        Returns one dict per (configuration, seed): the parameters, the seed and the metrics from summarize
+        """
+        cells = [(params, seed) for params in self.configurations for seed in self.seeds]
+        missing = [(params, seed) for params, seed in cells if not os.path.exists(self.cell_path(params, seed))]
+        self.cells_cached = len(cells) - len(missing)
+        self.cells_run = len(missing)
+        if missing:
+            arguments = [(partial(self.model_builder, **params), self.run_length, seed, self.cell_path(params, seed),
+                self.executor == "process") for params, seed in missing]
+            with self._pool() as pool:
+                if pool is None:
+                    for args in arguments:
+                        _run_cell(*args)
+                else:
+                    list(pool.map(_run_cell, *zip(*arguments)))
+        self.results = [dict(params, seed=seed, **self._summarize_cell(params, seed)) for params, seed in cells]
+        return self.results
+
+    def snapshot(self, params, seed):
+        """
+        the cached StatsSnapshot of one cell
+        """
+        path = self.cell_path(params, seed)
+        if not os.path.exists(path):
+            raise Exception(f"No cached results for {params} with seed {seed}, run the experiment first")
+        return StatsSnapshot.load(path)
+
+    def confidence_intervals(self, confidence=0.95):
+        """
+        for every configuration, its parameters and (mean, half_width) of each metric over the seeds
+        """
+        if not self.results:
+            raise Exception("Run the experiment before querying for confidence intervals")
+        intervals = []
+        for params in self.configurations:
+            rows = [row for row in self.results if all(row[name] == value for name, value in params.items())]
+            metrics = [metric for metric in rows[0] if metric not in params and metric != "seed"]
+            intervals.append(dict(params, **{ metric: OutputAnalysis.confidence_interval([row[metric] for row in rows], confidence)
+                for metric in metrics }))
+        return intervals
+
+    # private
+
+    @staticmethod
+    def _code_description(code):
+        # the repr of a code object holds its memory address, nested functions are described by their own contents instead
+        constants = [Experiment._code_description(constant) if inspect.iscode(constant) else repr(constant) for constant in code.co_consts]
+        return f"{code.co_code.hex()}|{constants}|{code.co_names}"
+
+    def _summarize_cell(self, params, seed):
+        previous_summary = Stats.summary
+        summary = self.snapshot(params, seed).restore()
+        try:
+            return self.summarize(summary.env)
+        finally:
+            Stats.summary = previous_summary
+
+    def _pool(self):
+        if self.workers == 1:
+            return nullcontext()
+        return Replications.EXECUTORS[self.executor](max_workers=self.workers)
+
+def _run_cell(model_builder, run_length, seed, path, seed_global_state):
+    # module level so it can be pickled by the process pool
+    _, model = _simulate(model_builder, run_length, seed, seed_global_state)
+    components = model if isinstance(model, (list, tuple)) else ()
+    containers = [component for component in components if isinstance(component, Container)]
+    # written to a temporary file first, so an interrupted run never leaves a half written cell behind
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    StatsSnapshot.capture(containers=containers).save(temporary_path)
+    os.replace(temporary_path, path)
+    Stats.summary = None
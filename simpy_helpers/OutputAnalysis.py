@@ -0,0 +1,219 @@
+import math
+import numpy as np
+from statistics import NormalDist
+from .Stats import Stats
+
+try:
+    from scipy import stats as scipy_stats
+except ImportError:
+    scipy_stats = None
+
+class OutputAnalysis:
+    """
+    Helpers for turning simulation output (replication summaries, waiting times, etc...) into confidence intervals.
+    """
+    MSER_BATCH_SIZE = 5
+    NUMBER_OF_BATCHES = 20
+
+    @staticmethod
+    def confidence_interval(values, confidence=0.95):
+        """
+        Student-t confidence interval for the mean of independent observations (e.g. one value per replication)
+        returns (mean, half_width). half_width is nan if there are fewer than 2 observations.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return np.nan, np.nan
+        mean = values.mean()
+        if len(values) < 2:
+            return mean, np.nan
+        standard_error = values.std(ddof=1) / np.sqrt(len(values))
+        return mean, OutputAnalysis.t_quantile(confidence, len(values) - 1) * standard_error
+
+    @staticmethod
+    def paired_difference_interval(values, other_values, confidence=0.95):
+        """
+        confidence interval for the mean difference between two configurations, pairing the i-th observation of each.
+        With common random numbers (the same seeds for both) the pairs are positively correlated,
+        so the interval is much narrower than comparing two independent intervals.
+        returns (mean, half_width) of values - other_values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        other_values = np.asarray(other_values, dtype=np.float64)
+        if len(values) != len(other_values):
+            raise Exception(f"Paired comparisons need the same number of observations, got {len(values)} and {len(other_values)}")
+        return OutputAnalysis.confidence_interval(values - other_values, confidence)
+
+    @staticmethod
+    def mser_truncation(values, batch_size=MSER_BATCH_SIZE):
+        """
+        MSER-m warm-up detection for a series of observations in the order they happened (e.g. Stats.get_waiting_times()).
+        Returns how many initial observations to delete: the truncation point that minimizes the marginal standard error
+        of the remaining batch means. Only the first half of the series is considered as warm-up.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        number_of_batches = len(values) // batch_size
+        if number_of_batches < 2:
+            return 0
+        batches = values[:number_of_batches * batch_size].reshape(number_of_batches, batch_size).mean(axis=1)
+        # statistics of the batches left after deleting the first d batches, for every d at once
+        remaining = np.arange(number_of_batches, 0, -1)
+        sums = np.cumsum(batches[::-1])[::-1]
+        sums_of_squares = np.cumsum(batches[::-1] ** 2)[::-1]
+        sum_of_squared_errors = sums_of_squares - sums ** 2 / remaining
+        marginal_standard_error = sum_of_squared_errors / remaining ** 2
+        return int(np.argmin(marginal_standard_error[:number_of_batches // 2 + 1])) * batch_size
+
+    @staticmethod
+    def batch_means_interval(values, number_of_batches=NUMBER_OF_BATCHES, confidence=0.95):
+        """
+        confidence interval for the steady state mean of one long, autocorrelated run.
+        The series is split into number_of_batches equal batches whose means are treated as independent.
+        returns (mean, half_width)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        batch_size = len(values) // number_of_batches
+        if batch_size < 1:
+            return OutputAnalysis.confidence_interval(values, confidence)
+        # leftovers are dropped from the start of the series, where the run is furthest from steady state
+        values = values[len(values) - batch_size * number_of_batches:]
+        return OutputAnalysis.confidence_interval(values.reshape(number_of_batches, batch_size).mean(axis=1), confidence)
+
+    @staticmethod
+    def steady_state_interval(values, number_of_batches=NUMBER_OF_BATCHES, confidence=0.95):
+        """
+        deletes the warm-up period found by mser_truncation, then returns (mean, half_width, truncation) from batch means
+        """
+        truncation = OutputAnalysis.mser_truncation(values)
+        mean, half_width = OutputAnalysis.batch_means_interval(np.asarray(values)[truncation:], number_of_batches, confidence)
+        return mean, half_width, truncation
+
+    @staticmethod
+    def relative_half_width(mean, half_width):
+        if mean == 0 or np.isnan(half_width):
+            return np.inf
+        return half_width / abs(mean)
+
+    @staticmethod
+    def t_quantile(confidence, degrees_of_freedom):
+        """
+        two sided critical value of the t distribution.
+        Uses scipy when it is installed. Otherwise the exact quantile for 1 to 4 degrees of freedom,
+        and a Cornish-Fisher expansion around the normal quantile for more
+        (accurate to a few parts in a thousand for 5 or more degrees of freedom).
+        """
+        p = 0.5 + confidence / 2.0
+        if scipy_stats is not None:
+            return float(scipy_stats.t.ppf(p, degrees_of_freedom))
+        if degrees_of_freedom == 1:
+            return math.tan(math.pi * (p - 0.5))
+        if degrees_of_freedom == 2:
+            return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+        if degrees_of_freedom in (3, 4):
+            return OutputAnalysis._invert_small_t(confidence, degrees_of_freedom)
+        z = NormalDist().inv_cdf(p)
+        v = float(degrees_of_freedom)
+        return (z
+            + (z**3 + z) / (4 * v)
+            + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * v**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * v**3)
+            + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * v**4))
+
+    @staticmethod
+    def _invert_small_t(confidence, degrees_of_freedom):
+        """
+        bisection on the closed form P(|T| < t) for 3 or 4 degrees of freedom (Abramowitz and Stegun 26.7.3 / 26.7.4)
+        """
+        def probability(t):
+            theta = math.atan(t / math.sqrt(degrees_of_freedom))
+            if degrees_of_freedom == 3:
+                return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta))
+            return math.sin(theta) * (1 + math.cos(theta)**2 / 2)
+        # the quantile with 1 degree of freedom is an upper bound for every other
+        low, high = 0.0, math.tan(math.pi * confidence / 2)
+        for _ in range(100):
+            middle = (low + high) / 2
+            if probability(middle) < confidence:
+                low = middle
+            else:
+                high = middle
+        return (low + high) / 2
+
+class RunController:
+    """
+    Runs a simulation until the steady state confidence interval of an entity metric is precise enough,
+    instead of guessing a run length for env.run(until=...).
+
+    metric - "waiting", "processing" or "total", read from Stats (optionally for one resource / attributes)
+    relative_precision - stop once half_width / |mean| is at most this
+    check_interval - how often (in simulated time) the interval is recomputed
+    max_time - stop here even if the precision hasn't been reached
+    min_observations - don't stop before this many disposed entities have been observed
+    The run also stops once nothing else is left to happen in the simulation, with precise set to False
+    if the precision wasn't reached.
+
+    controller = RunController(env, metric="waiting", relative_precision=0.05)
+    env.process(source.start())
+    result = controller.run()
+    """
+    METRICS = {
+        "waiting": Stats.get_waiting_times,
+        "processing": Stats.get_processing_times,
+        "total": Stats.get_total_times
+    }
+
+    def __init__(self, env, metric="waiting", relative_precision=0.05, confidence=0.95, check_interval=100,
+            max_time=float("Inf"), resource=None, attributes=None, number_of_batches=OutputAnalysis.NUMBER_OF_BATCHES, min_observations=1000):
+        if metric not in RunController.METRICS:
+            raise NotImplementedError(f"You must pick a metric in the list {list(RunController.METRICS)}")
+        self.env = env
+        self.metric = metric
+        self.relative_precision = relative_precision
+        self.confidence = confidence
+        self.check_interval = check_interval
+        self.max_time = max_time
+        self.resource = resource
+        self.attributes = attributes if attributes is not None else {}
+        self.number_of_batches = number_of_batches
+        self.min_observations = min_observations
+        self.result = None
+
+    def run(self):
+        """
+        runs the simulation until the precision (or max_time) is reached, and returns the final estimate
+        """
+        self._stop = self.env.event()
+        self.env.process(self._check())
+        self.env.run(until=self._stop)
+        return self.result
+
+    def estimate(self):
+        """
+        current steady state estimate of the metric, as a dict
+        """
+        values = RunController.METRICS[self.metric](self.resource, self.attributes)
+        if not isinstance(values, (list, np.ndarray)):
+            raise Exception("RunController needs the individual observations, it can't be used with Stats in streaming mode")
+        mean, half_width, truncation = OutputAnalysis.steady_state_interval(values, self.number_of_batches, self.confidence)
+        return {
+            "mean": mean,
+            "half_width": half_width,
+            "relative_half_width": OutputAnalysis.relative_half_width(mean, half_width),
+            "truncation": truncation,
+            "observations": len(values),
+            "time": self.env.now
+        }
+
+    def _check(self):
+        while True:
+            yield self.env.timeout(min(self.check_interval, max(self.max_time - self.env.now, 0)))
+            estimate = self.estimate()
+            precise = estimate["observations"] >= self.min_observations and estimate["relative_half_width"] <= self.relative_precision
+            # the model ran out of events (only the checker was left running), this is the final estimate
+            finished = self.env.peek() == float("Inf")
+            if precise or finished or self.env.now >= self.max_time:
+                estimate["precise"] = bool(precise)
+                self.result = estimate
+                self._stop.succeed()
+                return
@@ -0,0 +1,98 @@
+import threading
+from time import perf_counter
+
+class Profiler:
+    """
+    Opt-in instrumentation for finding out where a slow model spends its time.
+    Turn it on by creating the stats summary yourself before running: Stats(env, profile=True), then read Stats.profile()
+
+    Counts requests / releases per resource, puts / gets per container and entities created / disposed per entity type,
+    and accumulates the wall clock time spent inside user callbacks (service_time, interarrival_time, build_entity).
+    Also counts every simpy event the environment processes, to report simulated events per wall clock second.
+    Call sites check Profiler.ENABLED first, so nothing is measured when profiling is off.
+    """
+    ENABLED = False
+    _local = threading.local()
+
+    def __init__(self, env):
+        self.env = env
+        self.counters = {}
+        self.callback_seconds = {}
+        self.callback_calls = {}
+        self.events = 0
+        self.first_step = None
+        self.last_step = None
+        if env is not None:
+            self._count_steps(env)
+
+    @staticmethod
+    def activate(profiler):
+        """
+        makes profiler the current one for this thread (None turns profiling off)
+        """
+        Profiler._local.profiler = profiler
+        Profiler.ENABLED = profiler is not None
+
+    @staticmethod
+    def current():
+        return getattr(Profiler._local, "profiler", None)
+
+    @staticmethod
+    def count(component_name, counter):
+        profiler = Profiler.current()
+        if profiler is not None:
+            counters = profiler.counters.setdefault(component_name, {})
+            counters[counter] = counters.get(counter, 0) + 1
+
+    @staticmethod
+    def timed(component_name, callback_name, function, *args):
+        """
+        calls function(*args), adding the wall clock time it took to component_name's callback_name
+        """
+        profiler = Profiler.current()
+        if profiler is None:
+            return function(*args)
+        start = perf_counter()
+        try:
+            return function(*args)
+        finally:
+            key = (component_name, callback_name)
+            profiler.callback_seconds[key] = profiler.callback_seconds.get(key, 0) + perf_counter() - start
+            profiler.callback_calls[key] = profiler.callback_calls.get(key, 0) + 1
+
+    def report(self, resources={}):
+        """
+        resources - tracked resources, their peak queue length is added to the report
+        """
+        wall_seconds = self.last_step - self.first_step if self.first_step is not None else 0
+        components = { name: dict(counters) for name, counters in self.counters.items() }
+        for (name, callback_name), seconds in self.callback_seconds.items():
+            callbacks = components.setdefault(name, {}).setdefault("callbacks", {})
+            callbacks[callback_name] = { "seconds": seconds, "calls": self.callback_calls[(name, callback_name)] }
+        for name, resource in resources.items():
+            if hasattr(resource, "queue_length_stat"):
+                components.setdefault(name, {})["peak_queue_length"] = resource.queue_length_stat.maximum
+        callback_seconds = sum(self.callback_seconds.values())
+        return {
+            "events": self.events,
+            "wall_seconds": wall_seconds,
+            "events_per_wall_second": self.events / wall_seconds if wall_seconds > 0 else None,
+            "callback_seconds": callback_seconds,
+            "callback_fraction": callback_seconds / wall_seconds if wall_seconds > 0 else None,
+            "components": components
+        }
+
+    # private
+
+    def _count_steps(self, env):
+        # env.run calls self.step() for every event, so wrapping it on the instance counts everything processed
+        step = env.step
+        def counting_step():
+            if self.first_step is None:
+                self.first_step = perf_counter()
+            self.events += 1
+            try:
+                step()
+            finally:
+                self.last_step = perf_counter()
+        env.step = counting_step
@@ -0,0 +1,124 @@
+import hashlib
+import numpy as np
+from statistics import NormalDist
+
+try:
+    from scipy.special import ndtri
+except ImportError:
+    ndtri = None
+
+class RandomStream:
+    """
+    An independent random number stream for one component of the model.
+    Every variate is drawn by inverting its distribution function at a single uniform, so
+    - two runs using the same seed see the same uniforms in the same order (common random numbers),
+      even if one configuration makes a different distribution out of them
+    - with antithetic=True each uniform U is replaced by 1 - U, giving negatively correlated runs
+
+    size works like numpy: None returns a single value, otherwise an array of that shape.
+    generator is the underlying numpy Generator, draws made directly from it are never antithetic.
+    """
+    # keeps uniforms strictly inside (0, 1), so inverting them never gives an infinite variate
+    SMALLEST_UNIFORM = 2.0 ** -53
+
+    def __init__(self, seed_sequence, antithetic=False):
+        self.generator = np.random.Generator(np.random.PCG64(seed_sequence))
+        self.antithetic = antithetic
+
+    def random(self, size=None):
+        """
+        uniform on (0, 1)
+        """
+        u = self.generator.random(size)
+        if self.antithetic:
+            u = 1.0 - u
+        return np.clip(u, RandomStream.SMALLEST_UNIFORM, 1.0 - RandomStream.SMALLEST_UNIFORM)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.random(size)
+
+    def exponential(self, scale=1.0, size=None):
+        return -scale * np.log1p(-self.random(size))
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        u = self.random(size)
+        if ndtri is not None:
+            z = ndtri(u)
+        elif size is None:
+            z = NormalDist().inv_cdf(u)
+        else:
+            z = np.vectorize(NormalDist().inv_cdf)(u)
+        return loc + scale * z
+
+    def lognormal(self, mean=0.0, sigma=1.0, size=None):
+        return np.exp(self.normal(mean, sigma, size))
+
+    def triangular(self, left, mode, right, size=None):
+        u = self.random(size)
+        width = right - left
+        below_mode = left + np.sqrt(u * width * (mode - left))
+        above_mode = right - np.sqrt((1 - u) * width * (right - mode))
+        return np.where(u < (mode - left) / width, below_mode, above_mode)[()]
+
+    def integers(self, low, high=None, size=None):
+        """
+        integers from low (inclusive) to high (exclusive), or from 0 to low if high isn't given
+        """
+        if high is None:
+            low, high = 0, low
+        return (low + np.floor(self.random(size) * (high - low))).astype(np.int64)[()]
+
+    def choice(self, options, p=None, size=None):
+        """
+        picks from options, with probabilities p (equally likely by default)
+        """
+        weights = np.ones(len(options)) if p is None else np.asarray(p, dtype=np.float64)
+        cumulative = np.cumsum(weights) / np.sum(weights)
+        indexes = np.minimum(np.searchsorted(cumulative, self.random(size), side="right"), len(options) - 1)
+        if size is None:
+            return options[int(indexes)]
+        return np.asarray(options)[indexes]
+
+class RandomStreams:
+    """
+    Gives every Source and Resource of a run its own RandomStream (self.rng), derived from the run seed and the component's name.
+    Adding a component, or changing how often another one draws, doesn't shift the numbers the others see.
+
+        env = simpy.Environment()
+        RandomStreams(env, seed=42)                  # before the simulation runs
+        ...
+        class Server(Resource):
+            def service_time(self):
+                return self.rng.exponential(4)
+
+    Run a configuration with RandomStreams(env, seed, antithetic=True) to get the antithetic counterpart of the run with seed.
+    Without RandomStreams, a run gets streams seeded from np.random, so np.random.seed still makes runs reproducible.
+    Components with the same name share a stream, just like they share their Stats.
+    """
+    def __init__(self, env, seed=None, antithetic=False):
+        self.seed = seed if seed is not None else int(np.random.randint(2**32, dtype=np.int64))
+        self.antithetic = antithetic
+        self.streams = {}
+        env.random_streams = self
+
+    @staticmethod
+    def for_env(env):
+        """
+        the streams of env, created on first use if RandomStreams wasn't set up for it
+        """
+        streams = getattr(env, "random_streams", None)
+        if streams is None:
+            streams = RandomStreams(env)
+        return streams
+
+    def stream(self, name):
+        if name not in self.streams:
+            self.streams[name] = RandomStream(np.random.SeedSequence(self.seed, spawn_key=(RandomStreams._name_key(name),)), self.antithetic)
+        return self.streams[name]
+
+    # private
+
+    @staticmethod
+    def _name_key(name):
+        # hash() is salted per process, the stream of a name must be the same in every process
+        return int.from_bytes(hashlib.sha256(str(name).encode()).digest()[:8], "little")
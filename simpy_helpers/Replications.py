@@ -0,0 +1,161 @@
+import os
+import random
+from contextlib import nullcontext
+import simpy
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .Stats import Stats
+from .OutputAnalysis import OutputAnalysis
+from .RunningStat import RunningStat
+from .RandomStreams import RandomStreams
+
+class Replications:
+    """
+    Runs independent replications of a model, optionally across a pool of processes or threads.
+
+    model_builder(env, seed) - builds the model in a fresh simpy env and schedules its sources e.g. env.process(source.start())
+    run_length - each replication runs with env.run(until=run_length)
+    seeds - one replication is run per seed
+    summarize(env) (optional) - returns a dict of metrics for the replication that just finished.
+        It is called in the replication's own stats context, so the Stats methods can be used as usual.
+        Defaults to Replications.default_summary
+    workers - number of workers in the pool. workers=1 runs replications serially in this process.
+    executor - "process" or "thread".
+        Each replication gets its own Stats context either way, but threads share the global np.random state,
+        so only use threads when the model draws from its own generator (e.g. self.rng in sources and resources).
+    antithetic - run every seed twice, the second time with antithetic RandomStreams, and average each pair into one summary.
+
+    Each replication's env gets RandomStreams(env, seed), so sources and resources drawing from self.rng use
+    common random numbers across configurations run with the same seeds.
+    Compare two configurations with OutputAnalysis.paired_difference_interval on their per-replication summaries.
+
+    model_builder and summarize must be picklable (defined at module level) when using the process executor.
+    """
+    EXECUTORS = {
+        "process": ProcessPoolExecutor,
+        "thread": ThreadPoolExecutor
+    }
+
+    def __init__(self, model_builder, run_length, seeds, summarize=None, workers=None, executor="process", antithetic=False):
+        if executor not in Replications.EXECUTORS:
+            raise NotImplementedError(f"You must pick an executor in the list {list(Replications.EXECUTORS)}")
+        self.model_builder = model_builder
+        self.run_length = run_length
+        self.seeds = list(seeds)
+        self.summarize = summarize if summarize is not None else Replications.default_summary
+        self.workers = workers
+        self.executor = executor
+        self.antithetic = antithetic
+        self.results = []
+
+    def run(self):
+        """
+        runs every replication and returns the list of per-replication summaries (in seed order)
+        """
+        with self._pool() as pool:
+            self.results = self._run_seeds(pool, self.seeds)
+        return self.results
+
+    def run_until_precision(self, metric, relative_precision=0.05, confidence=0.95, min_replications=5, round_size=None):
+        """
+        launches replications in rounds of round_size (defaults to the number of workers) and stops
+        as soon as the confidence interval for metric has half_width / |mean| at most relative_precision.
+        self.seeds is the most replications that will be run. Returns the per-replication summaries that were run.
+        """
+        round_size = round_size or self.workers or os.cpu_count() or 1
+        self.results = []
+        with self._pool() as pool:
+            for start in range(0, len(self.seeds), round_size):
+                self.results.extend(self._run_seeds(pool, self.seeds[start:start + round_size]))
+                if len(self.results) >= min_replications:
+                    mean, half_width = OutputAnalysis.confidence_interval([summary[metric] for summary in self.results], confidence)
+                    if OutputAnalysis.relative_half_width(mean, half_width) <= relative_precision:
+                        break
+        return self.results
+
+    def confidence_intervals(self, confidence=0.95):
+        """
+        pools the replication summaries into {metric: (mean, half_width)}
+        """
+        if not self.results:
+            raise Exception("Run the replications before querying for confidence intervals")
+        metrics = []
+        for summary in self.results:
+            metrics.extend(metric for metric in summary if metric not in metrics)
+        return {
+            metric: OutputAnalysis.confidence_interval([summary.get(metric, np.nan) for summary in self.results], confidence)
+            for metric in metrics
+        }
+
+    @staticmethod
+    def default_summary(env):
+        """
+        mean total, waiting and processing times for disposed entities,
+        plus time average queue length and utilization for every resource that was visited
+        (and time average level for the containers of reopened or restored results)
+        """
+        total_times = Stats.get_total_times()
+        summary = {
+            "entities": len(total_times),
+            "mean_total_time": Replications._mean(total_times),
+            "mean_waiting_time": Replications._mean(Stats.get_waiting_times()),
+            "mean_processing_time": Replications._mean(Stats.get_processing_times())
+        }
+        for name, resource in Stats.summary.resources.items():
+            if hasattr(resource, "level_stat"):
+                # reopened / restored results keep their containers alongside the resources
+                summary[f"{name} time_average_level"] = resource.time_average_level()
+                continue
+            summary[f"{name} time_average_queue_length"] = Stats.time_average_queue_length(resource)
+            summary[f"{name} time_average_utilization"] = Stats.time_average_utilization(resource)
+        return summary
+
+    def _pool(self):
+        if self.workers == 1:
+            return nullcontext()
+        return Replications.EXECUTORS[self.executor](max_workers=self.workers)
+
+    def _run_seeds(self, pool, seeds):
+        antithetic_runs = (False, True) if self.antithetic else (False,)
+        arguments = [(self.model_builder, self.run_length, seed, self.summarize, self.executor == "process", antithetic)
+            for seed in seeds for antithetic in antithetic_runs]
+        if pool is None:
+            results = [_run_replication(*args) for args in arguments]
+        else:
+            results = list(pool.map(_run_replication, *zip(*arguments)))
+        if self.antithetic:
+            return [Replications._average_pair(results[i], results[i + 1]) for i in range(0, len(results), 2)]
+        return results
+
+    @staticmethod
+    def _average_pair(summary, antithetic_summary):
+        return { metric: (value + antithetic_summary[metric]) / 2 if metric in antithetic_summary else value
+            for metric, value in summary.items() }
+
+    @staticmethod
+    def _mean(values):
+        if isinstance(values, RunningStat):
+            return values.mean
+        return float(np.mean(values)) if len(values) > 0 else np.nan
+
+def _run_replication(model_builder, run_length, seed, summarize, seed_global_state, antithetic=False):
+    # module level so it can be pickled by the process pool
+    env, _ = _simulate(model_builder, run_length, seed, seed_global_state, antithetic)
+    summary = summarize(env)
+    Stats.summary = None
+    return summary
+
+def _simulate(model_builder, run_length, seed, seed_global_state, antithetic=False):
+    """
+    runs one replication in a fresh env and stats context, returns the env and whatever model_builder returned
+    """
+    if seed_global_state:
+        random.seed(seed)
+        np.random.seed(seed)
+    Stats.summary = None
+    env = simpy.Environment()
+    RandomStreams(env, seed, antithetic)
+    model = model_builder(env, seed)
+    env.run(until=run_length)
+    Stats._check_for_instance_or_raise()
+    return env, model
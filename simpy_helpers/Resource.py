@@ -1,118 +1,269 @@
+import inspect
 import simpy
 import numpy as np
+from .EventLog import EventLog, CoalescingEventLog, DownsampledEventLog
+from .TimeWeightedStat import TimeWeightedStat
+from .Profiler import Profiler
+from .RandomStreams import RandomStreams
 
 # This class defines methods to be mixed in to Resource and PriorityResource from simpy. 
 class ResourceStatsMixin:
-    VALID_SAMPLE_FREQUENCIES = [0.01, 0.1, 1]
-    DECIMAL_MAP = { # maps sample frequencies to decimals
-        .01: 2,
-        .1: 1,
-        1: 0
-    }
-
     @staticmethod
-    def _over_time(env, event_list, sample_frequency):
-        if sample_frequency not in ResourceStatsMixin.VALID_SAMPLE_FREQUENCIES:
-            raise NotImplementedError(f"You must pick a sample frequency in the list {ResourceStatsMixin.VALID_SAMPLE_FREQUENCIES}")
-        decimals = ResourceStatsMixin.DECIMAL_MAP[sample_frequency] 
-        rounded_event_list = ResourceStatsMixin._rounded_event_list(event_list, decimals)
-        current_size = 0
-        event_list_over_time = []
-        for i in np.around(np.arange(0, env.now + 1, sample_frequency), decimals):
-            if i in rounded_event_list:
-                # we found an activity that happened here
-                last_queue_check = rounded_event_list[i][-1][0]
-                current_size = last_queue_check
-            event_list_over_time.append(current_size)
-        
-        return event_list_over_time
-    
-    @staticmethod
-    def _rounded_event_list(event_list, decimals):
+    def _over_time(env, times, sizes, sample_frequency):
         """
-        Necessary for turning the list of events collected that capture utilization and queue size over time
-        into a "bucketed" list at rounded time intervals. 
-        
-        This allows queue/utilization sampling to work for continuous time.
+        Resamples the step function described by the recorded (times, sizes) columns.
+
+        sample_frequency can be any positive number, in which case samples are taken at 0, f, 2f, ... past env.now
+        and each event is snapped to its nearest sample tick (so continuous time events still show up when sampling).
+        It can also be an explicit array of sample times, in which case each sample holds the last size recorded at or before it.
         """
-        rounded_event_list = {}
-        for time, size, status in event_list:
-            rounded_time = np.around(time, decimals)
-            if rounded_time in rounded_event_list:
-                rounded_event_list[rounded_time].append((size, status))
-            else:
-                rounded_event_list[rounded_time] = [(size, status)]
-        return rounded_event_list  
+        if np.ndim(sample_frequency) == 0:
+            sample_frequency = ResourceStatsMixin._check_sample_frequency(sample_frequency)
+            number_of_samples = int(np.ceil((env.now + 1) / sample_frequency))
+            event_positions = np.around(times / sample_frequency)
+            sample_positions = np.arange(number_of_samples)
+        else:
+            event_positions = times
+            sample_positions = np.asarray(sample_frequency, dtype=np.float64)
+        # events are recorded in simulation order, so times are already sorted
+        last_event = np.searchsorted(event_positions, sample_positions, side='right') - 1
+        over_time = np.zeros(len(sample_positions), dtype=sizes.dtype)
+        has_event = last_event >= 0
+        over_time[has_event] = sizes[last_event[has_event]]
+        return over_time
+
+    @staticmethod
+    def _check_sample_frequency(sample_frequency):
+        if not sample_frequency > 0:
+            raise ValueError(f"sample_frequency must be a positive number, got {sample_frequency}")
+        return float(sample_frequency)
     
     def now(self):
         return self.env.now
+
+    @property
+    def rng(self):
+        """
+        this resource's own RandomStream, see RandomStreams
+        """
+        if getattr(self, "_rng", None) is None:
+            self._rng = RandomStreams.for_env(self.env).stream(self.name)
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng):
+        # any generator with the numpy distribution methods can be used instead
+        self._rng = rng
     
     # private
+    def _set_history_policy(self, coalesce_history, history_resolution, max_history_buckets, result_store):
+        if (coalesce_history or history_resolution is not None) and result_store is not None:
+            raise Exception(f"{self.name} can't coalesce or downsample its history when it is saved to a ResultStore")
+        if max_history_buckets is not None and history_resolution is None:
+            raise Exception(f"{self.name} needs a history_resolution to bound its history with max_history_buckets")
+        self.coalesce_history = coalesce_history
+        self.history_resolution = history_resolution
+        self.max_history_buckets = max_history_buckets
+
+    def _event_log(self, result_store, log_name, size_dtype=np.int64):
+        if result_store is not None:
+            return result_store.event_log(f"{self.name}.{log_name}", size_dtype)
+        if self.history_resolution is not None:
+            return DownsampledEventLog(self.history_resolution, self.max_history_buckets, size_dtype=size_dtype)
+        if self.coalesce_history:
+            return CoalescingEventLog(size_dtype=size_dtype)
+        return EventLog(size_dtype=size_dtype)
+
+    def _check_history_or_raise(self):
+        if not self.record_history:
+            raise Exception(f"History recording is turned off for {self.name}, use the time average statistics instead")
+
     def _zeros(self, sample_frequency):
-        if sample_frequency not in ResourceStatsMixin.VALID_SAMPLE_FREQUENCIES:
-            raise NotImplementedError(f"You must pick a sample frequency in the list {ResourceStatsMixin.VALID_SAMPLE_FREQUENCIES}")
-        decimals = ResourceStatsMixin.DECIMAL_MAP[sample_frequency] 
-        return [0 for _ in np.around(np.arange(0, self.env.now, sample_frequency), decimals)]
+        if np.ndim(sample_frequency) == 0:
+            sample_frequency = ResourceStatsMixin._check_sample_frequency(sample_frequency)
+            return np.zeros(int(np.ceil(self.env.now / sample_frequency)), dtype=np.int64)
+        return np.zeros(len(sample_frequency), dtype=np.int64)
     
 
 # all resources are priority resources
 class Resource(ResourceStatsMixin, simpy.PriorityResource):
-    def __init__(self, env, *args, **kwargs):
+    """
+    Define either service_time() / service_time(entity) returning one time, or service_times(n) returning an array of n times.
+    service_times is drawn in blocks of SERVICE_TIME_BATCH_SIZE, and can't depend on the entity being served.
+    Draw from self.rng (e.g. self.rng.exponential(4)) to give the resource its own random number stream.
+    """
+    SERVICE_TIME_BATCH_SIZE = 1024
+    # saved by a ResultStore
+    EVENT_LOGS = ("queue_size", "utilization_size")
+    TIME_WEIGHTED_STATS = ("queue_length_stat", "number_being_processed_stat")
+    POSITIONAL_PARAMETER_KINDS = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.VAR_POSITIONAL)
+
+    def __init__(self, env, *args, record_history=True, result_store=None, coalesce_history=False, history_resolution=None,
+            max_history_buckets=None, **kwargs):
+        """
+        record_history - keep the full event log needed for the *_over_time methods.
+            Time averages, minimums and maximums are always tracked, even when this is turned off.
+        result_store (optional) - a ResultStore to spill the event logs to disk
+        coalesce_history - keep one event log record per timestamp, *_over_time results are unchanged
+        history_resolution (optional) - keep one record per bucket of this many time units, with the exact minimum and
+            maximum of each bucket (see DownsampledEventLog). Sampling finer than the resolution is approximate.
+        max_history_buckets (optional) - with history_resolution, the most records kept, the resolution doubles as needed
+        """
         super().__init__(env, *args, **kwargs)
-        if self.service_time is None:
-            raise NotImplementedError("You must define a function called 'service_time' in your Resource class")
-        self.queue_size = []
-        self.utilization_size = []
+        if getattr(self, "service_time", None) is None and getattr(self, "service_times", None) is None:
+            raise NotImplementedError("You must define a function called 'service_time' (or 'service_times') in your Resource class")
+        self._service_time_buffer = iter(())
+        self._service_time_function = None
+        self.record_history = record_history
         self.env = env
         self.name = self.__class__.__name__
+        self._set_history_policy(coalesce_history, history_resolution, max_history_buckets, result_store)
+        self.queue_size = self._event_log(result_store, "queue_size")
+        self.utilization_size = self._event_log(result_store, "utilization_size")
+        self.queue_length_stat = TimeWeightedStat(env.now)
+        self.number_being_processed_stat = TimeWeightedStat(env.now)
+        if result_store is not None:
+            result_store._add_resource(self)
         
     def request(self, *args, **kwargs):
         req = super().request(*args, **kwargs)
+        if Profiler.ENABLED:
+            Profiler.count(self.name, "requests")
         self.add_resource_check(event='request')
         return req
 
     def release(self, *args, **kwargs):
         rel = super().release(*args, **kwargs)
-        self.utilization_size.append((self.env.now, self.count, 'release'))
+        if Profiler.ENABLED:
+            Profiler.count(self.name, "releases")
+        self._update_time_weighted_stats()
+        if self.record_history:
+            self.utilization_size.append(self.env.now, self.count, 'release')
         return rel
     
     def add_resource_check(self, event='start'):
-        self.utilization_size.append((self.env.now, self.count, event))
-        self.queue_size.append((self.env.now, len(self.queue), event))
+        self._update_time_weighted_stats()
+        if self.record_history:
+            self.utilization_size.append(self.env.now, self.count, event)
+            self.queue_size.append(self.env.now, len(self.queue), event)
+
+    def next_service_time(self, entity):
+        """
+        the service time for entity, drawn from the service_times batch when it is defined
+        """
+        if Profiler.ENABLED:
+            return Profiler.timed(self.name, "service_time", self._draw_service_time, entity)
+        return self._draw_service_time(entity)
+
+    def time_average_queue_length(self):
+        return self.queue_length_stat.mean(self.env.now)
+
+    def time_average_number_being_processed(self):
+        return self.number_being_processed_stat.mean(self.env.now)
+
+    def time_average_utilization(self):
+        return self.time_average_number_being_processed() / float(self.capacity)
 
     def queue_size_over_time(self, sample_frequency=1):
-        return ResourceStatsMixin._over_time(self.env, self.queue_size, sample_frequency)
+        self._check_history_or_raise()
+        return ResourceStatsMixin._over_time(self.env, self.queue_size.times, self.queue_size.sizes, sample_frequency)
     
     def number_being_processed_over_time(self, sample_frequency=1):
-        return ResourceStatsMixin._over_time(self.env, self.utilization_size, sample_frequency)
+        self._check_history_or_raise()
+        return ResourceStatsMixin._over_time(self.env, self.utilization_size.times, self.utilization_size.sizes, sample_frequency)
     
     def utilization_over_time(self, sample_frequency=1):
-        # iterate through each event, calculate the utilization
-        utilization = [(x, np.around(y / float(self.capacity), decimals=2), e) for x, y, e in self.utilization_size]
-        return ResourceStatsMixin._over_time(self.env, utilization, sample_frequency)  
+        self._check_history_or_raise()
+        utilization = np.around(self.utilization_size.sizes / float(self.capacity), decimals=2)
+        return ResourceStatsMixin._over_time(self.env, self.utilization_size.times, utilization, sample_frequency)
+
+    def _draw_service_time(self, entity):
+        if self._service_time_function is None:
+            self._service_time_function = self._resolve_service_time_function()
+        return self._service_time_function(entity)
+
+    def _resolve_service_time_function(self):
+        # works out once how to call the user's function, instead of probing its signature on every service
+        if getattr(self, "service_times", None) is not None:
+            return lambda entity: self._next_batched_service_time()
+        service_time = self.service_time
+        try:
+            parameters = inspect.signature(service_time).parameters.values()
+        except (TypeError, ValueError):
+            return self._probe_service_time
+        if any(parameter.kind in Resource.POSITIONAL_PARAMETER_KINDS for parameter in parameters):
+            return service_time
+        # if students do not define a resource function that depends on entity
+        # still allow them to call it.
+        return lambda entity: service_time()
+
+    def _probe_service_time(self, entity):
+        try: 
+            return self.service_time(entity)
+        except TypeError:
+            return self.service_time()
+
+    def _next_batched_service_time(self):
+        try:
+            return next(self._service_time_buffer)
+        except StopIteration:
+            self._service_time_buffer = iter(np.asarray(self.service_times(self.SERVICE_TIME_BATCH_SIZE)).tolist())
+            return next(self._service_time_buffer)
+
+    def _update_time_weighted_stats(self):
+        now = self.env.now
+        self.queue_length_stat.update(now, len(self.queue))
+        self.number_being_processed_stat.update(now, self.count)
 
 class Container(ResourceStatsMixin, simpy.Container):
     """
     Container with amount tracking over time.
     """
-    def __init__(self, env, *args, **kwargs):
+    # saved by a ResultStore
+    EVENT_LOGS = ("level_tracker",)
+    TIME_WEIGHTED_STATS = ("level_stat",)
+
+    def __init__(self, env, *args, record_history=True, result_store=None, coalesce_history=False, history_resolution=None,
+            max_history_buckets=None, **kwargs):
+        """
+        record_history - keep the full event log needed for level_over_time.
+            Time averages, minimums and maximums are always tracked, even when this is turned off.
+        result_store (optional) - a ResultStore to spill the event log to disk
+        coalesce_history, history_resolution, max_history_buckets - see Resource
+        """
         super().__init__(env, *args, **kwargs)
-        self.level_tracker = []
+        self.record_history = record_history
         self.env = env
         self.name = self.__class__.__name__
-        self.level_tracker.append((self.env.now, self.level, "init"))
+        self._set_history_policy(coalesce_history, history_resolution, max_history_buckets, result_store)
+        self.level_tracker = self._event_log(result_store, "level_tracker", np.float64)
+        self.level_stat = TimeWeightedStat(env.now, self.level)
+        if result_store is not None:
+            result_store._add_resource(self)
+        if self.record_history:
+            self.level_tracker.append(self.env.now, self.level, "init")
         
     def put(self, amount):
         super().put(amount)
+        if Profiler.ENABLED:
+            Profiler.count(self.name, "puts")
         self.add_resource_check()
     
     def get(self, amount):
         retrieved_amount = super().get(amount)
+        if Profiler.ENABLED:
+            Profiler.count(self.name, "gets")
         self.add_resource_check(event="get")
         return retrieved_amount
 
     def add_resource_check(self, event="put"):
-        self.level_tracker.append((self.env.now, self.level, event))
+        self.level_stat.update(self.env.now, self.level)
+        if self.record_history:
+            self.level_tracker.append(self.env.now, self.level, event)
+
+    def time_average_level(self):
+        return self.level_stat.mean(self.env.now)
     
     def level_over_time(self, sample_frequency=1):
-        return ResourceStatsMixin._over_time(self.env, self.level_tracker, sample_frequency)
\ No newline at end of file
+        self._check_history_or_raise()
+        return ResourceStatsMixin._over_time(self.env, self.level_tracker.times, self.level_tracker.sizes, sample_frequency)
\ No newline at end of file
@@ -0,0 +1,263 @@
+import os
+import json
+import numpy as np
+from types import SimpleNamespace
+from .EventLog import EventLog
+from .Resource import ResourceStatsMixin, Resource, Container
+from .TimeWeightedStat import TimeWeightedStat
+
+class StoredTable:
+    """
+    An append only table of typed columns, stored as one raw binary file per column.
+    Rows are buffered in memory and appended to the files in chunks of chunk_size rows,
+    columns are read back lazily through memory maps.
+    """
+    def __init__(self, store, name, columns):
+        self.store = store
+        self.name = name
+        self.columns = {column: np.dtype(dtype) for column, dtype in columns.items()}
+        self._buffers = None
+        if store.writable:
+            self._buffers = [np.empty(store.chunk_size, dtype=dtype) for dtype in self.columns.values()]
+        self._length = 0
+
+    def append(self, *values):
+        """
+        values are given in the order of the columns
+        """
+        i = self._length
+        for buffer, value in zip(self._buffers, values):
+            buffer[i] = value
+        self._length = i + 1
+        if self._length == self.store.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._length:
+            return
+        for column, buffer in zip(self.columns, self._buffers):
+            with open(self._path(column), "ab") as f:
+                f.write(buffer[:self._length].tobytes())
+        self._length = 0
+
+    def column(self, column):
+        """
+        read only memory mapped view of everything appended to the column so far
+        """
+        if self.store.writable:
+            self.flush()
+        path = self._path(column)
+        dtype = self.columns[column]
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def __len__(self):
+        column = next(iter(self.columns))
+        path = self._path(column)
+        on_disk = os.path.getsize(path) // self.columns[column].itemsize if os.path.exists(path) else 0
+        return on_disk + self._length
+
+    def _path(self, column):
+        return os.path.join(self.store.path, f"{self.name}.{column}.bin")
+
+class DiskEventLog(EventLog):
+    """
+    EventLog that spills to a StoredTable, only the current chunk is kept in memory.
+    times, sizes and events are memory mapped views of the files.
+    """
+    def __init__(self, table):
+        self._table = table
+
+    def append(self, time, size, event):
+        self._table.append(time, size, EventLog.event_code(event))
+
+    @property
+    def times(self):
+        return self._table.column("time")
+
+    @property
+    def sizes(self):
+        return self._table.column("size")
+
+    @property
+    def events(self):
+        return self._table.column("event")
+
+    def __len__(self):
+        return len(self._table)
+
+class StoredResource(ResourceStatsMixin):
+    """
+    Read only stand in for a Resource or Container from a reopened ResultStore (or a restored StatsSnapshot).
+    Supports the same *_over_time and time average methods as the live resource did.
+    """
+    queue_size_over_time = Resource.queue_size_over_time
+    number_being_processed_over_time = Resource.number_being_processed_over_time
+    utilization_over_time = Resource.utilization_over_time
+    time_average_queue_length = Resource.time_average_queue_length
+    time_average_number_being_processed = Resource.time_average_number_being_processed
+    time_average_utilization = Resource.time_average_utilization
+    level_over_time = Container.level_over_time
+    time_average_level = Container.time_average_level
+
+    def __init__(self, name, info, now, event_logs):
+        """
+        info - capacity, record_history and the state of each TimeWeightedStat, as saved by ResultStore.flush
+        event_logs - the EventLog for each of the resource's EVENT_LOGS
+        """
+        self.name = name
+        self.env = SimpleNamespace(now=now)
+        self.capacity = info["capacity"]
+        self.record_history = info["record_history"]
+        self.EVENT_LOGS = tuple(event_logs)
+        self.TIME_WEIGHTED_STATS = tuple(info["time_weighted_stats"])
+        for log_name, event_log in event_logs.items():
+            setattr(self, log_name, event_log)
+        for stat_name, state in info["time_weighted_stats"].items():
+            stat = TimeWeightedStat.__new__(TimeWeightedStat)
+            stat.__dict__.update(state)
+            setattr(self, stat_name, stat)
+
+class ResultStore:
+    """
+    Keeps simulation results on disk so memory stays flat however long the simulation runs.
+    Pass the same store to your resources / containers and to Stats before running:
+
+        store = ResultStore("results/run_1")
+        server = Server(env, capacity=2, result_store=store)
+        Stats(env, result_store=store)
+        ...
+        env.run(until=...)
+        store.close()
+
+    Later (or in another process), Stats.open("results/run_1") reopens the results for querying without re-running.
+    Tables are stored as raw binary column files alongside a schema.json describing them.
+
+    The store of an earlier run in the same directory is replaced. A directory holding .bin files but no schema.json
+    (e.g. from a run that never closed its store) is only cleared with overwrite=True, anything else raises.
+
+    Numeric attribute values are stored as numbers. Other attribute values are dictionary encoded by their string form,
+    and every distinct one is kept in memory and in schema.json, so attributes with a value per entity (an order id string, ...)
+    would make memory grow with the run. List them in excluded_attributes to leave them out of the store.
+    """
+    SCHEMA_FILE = "schema.json"
+    DEFAULT_CHUNK_SIZE = 65536
+    # value code of attributes stored in the numeric column instead of being dictionary encoded
+    NUMBER_CODE = -1
+
+    def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE, writable=True, excluded_attributes=(), overwrite=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.writable = writable
+        self.excluded_attributes = set(excluded_attributes)
+        self.tables = {}
+        self.categories = {}
+        self.now = 0
+        self.resource_info = {}
+        self._resources = []
+        self._codes = {}
+        if writable:
+            os.makedirs(path, exist_ok=True)
+            self._clear(overwrite)
+
+    @staticmethod
+    def open(path):
+        """
+        reopens a closed store for reading
+        """
+        with open(os.path.join(path, ResultStore.SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        store = ResultStore(path, writable=False)
+        store.now = schema["now"]
+        store.categories = schema["categories"]
+        store.resource_info = schema["resources"]
+        EventLog.register_event_names(schema.get("event_names", {}))
+        for name, columns in schema["tables"].items():
+            store.table(name, columns)
+        return store
+
+    def table(self, name, columns):
+        if name not in self.tables:
+            self.tables[name] = StoredTable(self, name, columns)
+        return self.tables[name]
+
+    def event_log(self, name, size_dtype=np.int64):
+        return DiskEventLog(self.table(name, { "time": np.float64, "size": size_dtype, "event": np.int8 }))
+
+    def category_code(self, category, value):
+        """
+        small integer code for a value (e.g. a resource name or an attribute value), values are compared by their string form
+        """
+        codes = self._category_codes(category)
+        value = str(value)
+        if value not in codes:
+            codes[value] = len(codes)
+            self.categories.setdefault(category, []).append(value)
+        return codes[value]
+
+    @staticmethod
+    def is_number(value):
+        """
+        whether an attribute value is stored in the numeric column, booleans are dictionary encoded like other values
+        """
+        return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+    def lookup_category_code(self, category, value):
+        """
+        like category_code, but returns None for values that were never stored
+        """
+        return self._category_codes(category).get(str(value))
+
+    def stored_resources(self):
+        return { name: StoredResource(name, info, self.now, self._event_logs(name, info))
+            for name, info in self.resource_info.items() }
+
+    def flush(self):
+        """
+        writes out every buffered row and the schema, so the store can be reopened
+        """
+        for table in self.tables.values():
+            table.flush()
+        for resource in self._resources:
+            self.now = max(self.now, resource.env.now)
+            self.resource_info[resource.name] = {
+                "capacity": resource.capacity,
+                "record_history": resource.record_history,
+                "event_logs": { log_name: getattr(resource, log_name).sizes.dtype.str for log_name in resource.EVENT_LOGS },
+                "time_weighted_stats": { stat_name: vars(getattr(resource, stat_name)) for stat_name in resource.TIME_WEIGHTED_STATS }
+            }
+        schema = {
+            "now": self.now,
+            "tables": { name: { column: dtype.str for column, dtype in table.columns.items() } for name, table in self.tables.items() },
+            "categories": self.categories,
+            "event_names": EventLog.EVENT_NAMES,
+            "resources": self.resource_info
+        }
+        with open(os.path.join(self.path, ResultStore.SCHEMA_FILE), "w") as f:
+            json.dump(schema, f, default=float)
+
+    def close(self):
+        self.flush()
+
+    # private
+
+    def _clear(self, overwrite):
+        # start from a clean directory, appending to the files of an old run would mix the two.
+        # Only the files of a store are removed, and only when the directory is known to hold one
+        store_files = [file_name for file_name in os.listdir(self.path) if file_name.endswith(".bin") or file_name == ResultStore.SCHEMA_FILE]
+        if store_files and not overwrite and ResultStore.SCHEMA_FILE not in store_files:
+            raise Exception(f"{self.path} holds .bin files but isn't a ResultStore, pass overwrite=True to replace them")
+        for file_name in store_files:
+            os.remove(os.path.join(self.path, file_name))
+
+    def _add_resource(self, resource):
+        self._resources.append(resource)
+
+    def _event_logs(self, name, info):
+        return { log_name: self.event_log(f"{name}.{log_name}", size_dtype) for log_name, size_dtype in info["event_logs"].items() }
+
+    def _category_codes(self, category):
+        if category not in self._codes:
+            self._codes[category] = { value: code for code, value in enumerate(self.categories.get(category, [])) }
+        return self._codes[category]
@@ -0,0 +1,180 @@
+import numpy as np
+from .Entity import Visit
+from .Stats import Stats
+from .Trace import Trace
+from .RandomStreams import RandomStreams
+
+class Branch:
+    """
+    sends the entity down one of options, picked at random with the given probabilities.
+    Each option is a resource, a Route, a list of steps, or None to skip the branch.
+    """
+    def __init__(self, options, probabilities):
+        if len(options) != len(probabilities):
+            raise Exception("Branch needs one probability per option")
+        if not np.isclose(sum(probabilities), 1):
+            raise Exception(f"Branch probabilities must add up to 1, got {sum(probabilities)}")
+        self.options = list(options)
+        self.probabilities = list(probabilities)
+
+# default of ByAttribute when unmatched values should raise, None already means skip
+_NO_DEFAULT = object()
+
+class ByAttribute:
+    """
+    sends the entity down the option matching the value of one of its attributes e.g.
+        ByAttribute("severity", { "high": icu, "low": ward }, default=waiting_room)
+    Like in Branch, an option (or the default) of None skips the step.
+    Without a default, an entity whose value matches no option raises.
+    """
+    def __init__(self, attribute, options, default=_NO_DEFAULT):
+        self.attribute = attribute
+        self.options = dict(options)
+        self.default = default
+
+class Rework:
+    """
+    runs steps, then repeats them with probability after every pass (e.g. parts failing inspection)
+        Rework(machine, inspection, probability=0.1)
+    """
+    def __init__(self, *steps, probability):
+        if not 0 <= probability < 1:
+            raise Exception(f"Rework probability must be at least 0 and less than 1, got {probability}")
+        self.steps = list(steps)
+        self.probability = probability
+
+class Route:
+    """
+    Declarative alternative to writing the wait_for_resource / process_at_resource / release_resource loop by hand.
+    Steps are resources (visited in order), Branch, ByAttribute, Rework or other Routes.
+
+        line = Route(cutting, Branch([painting, None], [0.3, 0.7]), Rework(assembly, inspection, probability=0.05))
+
+        class Part(Entity):
+            def process(self):
+                return line.run(self)
+
+    The steps are compiled into a flat list of instructions once, and run() walks them in a single generator,
+    keeping the bookkeeping of each visit inline rather than going through the entity methods.
+    Stats, Trace and Profiler see exactly what they would for the hand written process.
+    Random branching draws from the RandomStream called name (see RandomStreams).
+    """
+    VISIT = 0
+    JUMP = 1
+    CHOOSE = 2
+    SWITCH = 3
+    REPEAT = 4
+
+    def __init__(self, *steps, name="Route"):
+        self.steps = list(steps)
+        self.name = name
+        self.instructions = []
+        self._compile(self.steps)
+
+    def run(self, entity):
+        """
+        generator that moves entity through the route, return it from Entity.process or yield from it
+        """
+        env = entity.env
+        instructions = self.instructions
+        visited = set(entity.visited_resource_names())
+        stream = None
+        i = 0
+        while i < len(instructions):
+            instruction = instructions[i]
+            kind = instruction[0]
+            if kind == Route.VISIT:
+                resource = instruction[1]
+                if Trace.ENABLED:
+                    Trace.event(env.now, "request", entity, resource)
+                Stats._add_resource(resource)
+                if resource.name not in visited:
+                    visited.add(resource.name)
+                    Stats._add_visit(entity, resource.name)
+                visit = Visit(resource.name, env.now)
+                entity.visits.append(visit)
+                visit.request = resource.request(priority=entity.attributes["priority"])
+                yield visit.request
+
+                if Trace.ENABLED:
+                    Trace.event(env.now, "start", entity, resource)
+                visit.start_service_time = env.now
+                entity.waiting_time += visit.start_service_time - visit.arrival_time
+                resource.add_resource_check()
+                try:
+                    service_time = resource.next_service_time(entity)
+                except Exception:
+                    raise Exception(f"Error when calling {resource.name} service time function")
+                yield env.timeout(service_time)
+
+                if Trace.ENABLED:
+                    Trace.event(env.now, "release", entity, resource)
+                visit.finish_service_time = env.now
+                entity.processing_time += visit.finish_service_time - visit.start_service_time
+                resource.release(visit.request)
+                visit.request = None
+                i += 1
+            elif kind == Route.JUMP:
+                i = instruction[1]
+            elif kind == Route.SWITCH:
+                _, attribute, targets, default = instruction
+                i = targets.get(entity.attributes.get(attribute), default)
+                if i is None:
+                    raise Exception(f"{entity.name} has no route for {attribute} = {entity.attributes.get(attribute)}")
+            else:
+                if stream is None:
+                    stream = RandomStreams.for_env(env).stream(self.name)
+                if kind == Route.CHOOSE:
+                    _, cumulative, targets = instruction
+                    i = targets[min(int(np.searchsorted(cumulative, stream.random(), side="right")), len(targets) - 1)]
+                else:
+                    _, probability, target = instruction
+                    i = target if stream.random() < probability else i + 1
+
+    # private
+
+    def _compile(self, steps):
+        for step in steps:
+            if isinstance(step, Route):
+                self._compile(step.steps)
+            elif isinstance(step, (list, tuple)):
+                self._compile(step)
+            elif isinstance(step, Branch):
+                choose = self._placeholder()
+                targets = self._compile_options(step.options)
+                self.instructions[choose] = (Route.CHOOSE, np.cumsum(step.probabilities) / np.sum(step.probabilities), targets)
+            elif isinstance(step, ByAttribute):
+                switch = self._placeholder()
+                values = list(step.options)
+                options = [step.options[value] for value in values]
+                if step.default is not _NO_DEFAULT:
+                    options.append(step.default)
+                targets = self._compile_options(options)
+                default = targets.pop() if step.default is not _NO_DEFAULT else None
+                self.instructions[switch] = (Route.SWITCH, step.attribute, dict(zip(values, targets)), default)
+            elif isinstance(step, Rework):
+                start = len(self.instructions)
+                self._compile(step.steps)
+                self.instructions.append((Route.REPEAT, step.probability, start))
+            elif hasattr(step, "request") and hasattr(step, "next_service_time"):
+                self.instructions.append((Route.VISIT, step))
+            else:
+                raise Exception(f"{step} can't be used as a route step, use a Resource, Branch, ByAttribute, Rework or Route")
+
+    def _compile_options(self, options):
+        """
+        compiles each option followed by a jump past all of them, returns where each option starts
+        """
+        targets, jumps = [], []
+        for option in options:
+            targets.append(len(self.instructions))
+            if option is not None:
+                self._compile([option])
+            jumps.append(self._placeholder())
+        for jump in jumps:
+            self.instructions[jump] = (Route.JUMP, len(self.instructions))
+        return targets
+
+    def _placeholder(self):
+        self.instructions.append(None)
+        return len(self.instructions) - 1
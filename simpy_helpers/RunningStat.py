@@ -0,0 +1,109 @@
+import math
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for non-negative values (waiting times, processing times, etc...)
+    Values are counted in logarithmic buckets, so every quantile is within relative_accuracy of the true value
+    while memory only grows with the logarithm of the range of values seen.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise Exception("Only sketches with the same relative_accuracy can be merged")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+class RunningStat:
+    """
+    Count, mean, variance, min and max of a stream of values (Welford's algorithm), plus a QuantileSketch.
+    Used in place of a list of values when Stats is running in streaming mode.
+    RunningStats from different resources, attribute groups or runs can be combined with merge.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.mean = math.nan
+        self.minimum = math.nan
+        self.maximum = math.nan
+        self._m2 = 0.0
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value):
+        self.count += 1
+        if self.count == 1:
+            self.mean = float(value)
+            self.minimum = value
+            self.maximum = value
+        else:
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+            self.minimum = min(self.minimum, value)
+            self.maximum = max(self.maximum, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.mean, self.minimum, self.maximum, self._m2 = other.mean, other.minimum, other.maximum, other._m2
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self._m2 += other._m2 + delta * delta * self.count * other.count / count
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        self.count += other.count
+        self.sketch.merge(other.sketch)
+        return self
+
+    def variance(self):
+        """
+        sample variance (ddof=1), nan for fewer than 2 values
+        """
+        if self.count < 2:
+            return math.nan
+        return self._m2 / (self.count - 1)
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return f"RunningStat(count={self.count}, mean={self.mean}, std={self.std()}, min={self.minimum}, max={self.maximum})"
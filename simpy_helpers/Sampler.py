@@ -0,0 +1,204 @@
+import os
+import json
+import socket
+from .Stats import Stats
+
+class Sampler:
+    """
+    Samples the state of the simulation every interval of simulated time while it runs, and pushes each sample to sinks.
+    Nothing is read from the event history, so resources can be created with record_history=False.
+
+        sampler = Sampler(env, interval=10, sinks=[CallbackSink(print)], containers=[tank])
+        env.process(sampler.start())
+        env.process(source.start())
+        env.run(until=...)
+        sampler.close()
+
+    Each sample is a dict:
+        time, wip (entities in the system), arrived, disposed
+        resources - for every resource visited so far (or the resources given), its queue_length, busy servers, utilization,
+            their time averages over the last interval (average_queue_length, average_busy),
+            and running waiting time aggregates of disposed entities (waiting_count, mean_waiting_time, max_waiting_time)
+        containers - level and average_level over the last interval for each container given
+        waiting - running count, mean and max of the total waiting time of disposed entities
+    Sampling stops by itself once nothing else is left to happen in the simulation.
+    """
+    def __init__(self, env, interval, sinks=(), resources=None, containers=()):
+        if not interval > 0:
+            raise ValueError(f"interval must be a positive number, got {interval}")
+        self.env = env
+        self.interval = interval
+        self.sinks = list(sinks)
+        self.resources = resources
+        self.containers = list(containers)
+        self.samples_taken = 0
+        self._integrals = {}
+        self._waiting = { None: [0, 0.0, 0.0] }
+
+    def start(self):
+        summary = Stats._summary_for_env(self.env)
+        summary.dispose_listeners.append(self._record_waiting_times)
+        self._last_time = self.env.now
+        resources = self.resources if self.resources is not None else list(summary.resources.values())
+        for resource in resources:
+            self._integrals[(resource.name, "queue")] = resource.queue_length_stat.integral_until(self._last_time)
+            self._integrals[(resource.name, "busy")] = resource.number_being_processed_stat.integral_until(self._last_time)
+        for container in self.containers:
+            self._integrals[(container.name, "level")] = container.level_stat.integral_until(self._last_time)
+        while True:
+            yield self.env.timeout(self.interval)
+            self.sample()
+            if self.env.peek() == float("Inf"):
+                # only the sampler was left running
+                return
+
+    def sample(self):
+        """
+        takes a sample now and writes it to every sink, returns the sample
+        """
+        summary = Stats.summary
+        now = self.env.now
+        elapsed = now - self._last_time
+        resources = self.resources if self.resources is not None else list(summary.resources.values())
+        sample = {
+            "time": now,
+            "wip": summary.entities_arrived - summary.entities_disposed,
+            "arrived": summary.entities_arrived,
+            "disposed": summary.entities_disposed,
+            "resources": { resource.name: self._resource_sample(resource, now, elapsed) for resource in resources },
+            "containers": { container.name: {
+                "level": container.level,
+                "average_level": self._interval_average(container.name, "level", container.level_stat, now, elapsed)
+            } for container in self.containers },
+            "waiting": Sampler._aggregate(self._waiting[None])
+        }
+        self._last_time = now
+        self.samples_taken += 1
+        for sink in self.sinks:
+            sink.write(sample)
+        return sample
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    # private
+
+    def _resource_sample(self, resource, now, elapsed):
+        waiting = Sampler._aggregate(self._waiting.get(resource.name, [0, 0.0, 0.0]))
+        return {
+            "queue_length": len(resource.queue),
+            "busy": resource.count,
+            "utilization": resource.count / float(resource.capacity),
+            "average_queue_length": self._interval_average(resource.name, "queue", resource.queue_length_stat, now, elapsed),
+            "average_busy": self._interval_average(resource.name, "busy", resource.number_being_processed_stat, now, elapsed),
+            "waiting_count": waiting["count"],
+            "mean_waiting_time": waiting["mean"],
+            "max_waiting_time": waiting["max"]
+        }
+
+    def _interval_average(self, name, quantity, stat, now, elapsed):
+        # time average since the last sample, from the difference of the running integrals.
+        # Resources first visited after the last sample were idle (queue and busy of 0) until then
+        integral = stat.integral_until(now)
+        key = (name, quantity)
+        previous = self._integrals.get(key, 0)
+        self._integrals[key] = integral
+        if elapsed <= 0:
+            return stat.last_value
+        return (integral - previous) / elapsed
+
+    def _record_waiting_times(self, entity):
+        Sampler._add(self._waiting[None], entity.get_total_waiting_time())
+        for resource_name in entity.visited_resource_names():
+            if resource_name not in self._waiting:
+                self._waiting[resource_name] = [0, 0.0, 0.0]
+            Sampler._add(self._waiting[resource_name], entity._calculate_waiting_time_for_resource(resource_name))
+
+    @staticmethod
+    def _add(aggregate, value):
+        aggregate[0] += 1
+        aggregate[1] += value
+        if value > aggregate[2]:
+            aggregate[2] = value
+
+    @staticmethod
+    def _aggregate(aggregate):
+        count, total, maximum = aggregate
+        return { "count": count, "mean": total / count if count else None, "max": maximum if count else None }
+
+class CallbackSink:
+    """
+    calls function(sample) for every sample
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def write(self, sample):
+        self.function(sample)
+
+    def close(self):
+        pass
+
+class GeneratorSink:
+    """
+    sends every sample into a generator (consumer.send(sample)), e.g. a running plot or an online analysis:
+
+        def consumer():
+            while True:
+                sample = yield
+                ...
+    """
+    def __init__(self, consumer):
+        self.consumer = consumer
+        next(self.consumer)
+
+    def write(self, sample):
+        self.consumer.send(sample)
+
+    def close(self):
+        self.consumer.close()
+
+class RotatingFileSink:
+    """
+    Appends one JSON object per sample to path. Once the file reaches max_bytes it is renamed to path.1
+    (path.1 to path.2, ...) and a new file is started, keeping at most backups old files.
+    """
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, "w")
+
+    def write(self, sample):
+        self._file.write(json.dumps(sample, default=float) + "\n")
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def close(self):
+        self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w")
+
+class SocketSink:
+    """
+    Streams one JSON object per line to a local socket, so a dashboard in another process can follow the run.
+    address is the path of a unix socket, or a (host, port) pair for TCP.
+    """
+    def __init__(self, address):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.connect(address)
+
+    def write(self, sample):
+        self._socket.sendall((json.dumps(sample, default=float) + "\n").encode())
+
+    def close(self):
+        self._socket.close()
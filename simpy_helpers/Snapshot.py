@@ -0,0 +1,305 @@
+import pickle
+import numpy as np
+from types import SimpleNamespace
+from .Stats import Stats
+from .Entity import Entity, Visit
+from .EventLog import EventLog
+from .RunningStat import RunningStat
+from .ResultStore import StoredResource
+from .TimeWeightedStat import TimeWeightedStat
+
+class StatsSnapshot:
+    """
+    Compact, picklable copy of a Stats summary that doesn't hold on to the environment, entities or simpy resources.
+    Disposed entities are kept as columns of per entity and per visit metrics, resources as copies of their event logs
+    and time weighted stats, and a streaming summary as its RunningStats.
+    Entities that haven't been disposed yet are not part of a snapshot.
+
+        snapshot = StatsSnapshot.capture()          # e.g. every so often to checkpoint a long run
+        snapshot.save("checkpoints/run_1.pkl")
+        ...
+        merged = StatsSnapshot.merge([StatsSnapshot.load(path) for path in paths])
+        merged.restore()                            # makes it the current Stats.summary
+        Stats.get_waiting_times()
+
+    Merged runs are laid end to end in time: each snapshot's times are offset by the end times of the ones before it,
+    so time averages are pooled over all runs and *_over_time shows the runs one after another.
+    Only plain attribute values are kept (numbers, strings, ... and tuples of them), attributes holding
+    other objects such as resources would drag the whole simulation along and are left out.
+    Classes, such as the "type" attribute of every entity, are kept as their "module.QualifiedName".
+    Queries on a restored summary may still use the class itself, e.g. attributes={ "type": Customer }.
+    """
+    VERSION = 2
+    PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes, np.generic)
+    ENTITY_COLUMNS = ("id", "creation_time", "disposal_time", "total", "waiting", "processing")
+    VISIT_COLUMNS = ("entity_id", "resource", "arrival_time", "start_service_time", "finish_service_time")
+
+    def __init__(self, now, entities, visits, attributes, resource_names, resources, group_by=(), streaming_summaries=None, runs=1):
+        """
+        entities / visits - dicts of the ENTITY_COLUMNS / VISIT_COLUMNS arrays (visit resources are indexes into resource_names)
+        attributes - the attributes dict of each entity, in the order of entities
+        resources - info for each resource name: capacity, record_history, event_logs and time_weighted_stats
+        """
+        self.version = StatsSnapshot.VERSION
+        self.now = now
+        self.entities = entities
+        self.visits = visits
+        self.attributes = attributes
+        self.resource_names = resource_names
+        self.resources = resources
+        self.group_by = tuple(group_by)
+        self.streaming_summaries = streaming_summaries if streaming_summaries is not None else {}
+        self.runs = runs
+
+    @staticmethod
+    def capture(summary=None, containers=()):
+        """
+        snapshot of summary (the current Stats.summary by default).
+        containers - containers to include, Stats only tracks the resources entities visited
+        """
+        summary = summary if summary is not None else Stats.summary
+        if summary is None:
+            raise Exception("Run a simulation before taking a snapshot of its statistics")
+        if summary.result_store is not None:
+            raise Exception("Stats using a ResultStore are already saved on disk, reopen them with Stats.open(path)")
+        entities = summary._get_disposed_entities()
+        resource_names = list(summary.resources)
+        for entity in entities:
+            for resource_name in entity.visited_resource_names():
+                if resource_name not in resource_names:
+                    resource_names.append(resource_name)
+        resource_codes = { name: code for code, name in enumerate(resource_names) }
+        visits = [(entity.id, resource_codes[visit.resource_name], visit.arrival_time,
+            StatsSnapshot._nan_if_none(visit.start_service_time), StatsSnapshot._nan_if_none(visit.finish_service_time))
+            for entity in entities for visit in entity.visits]
+        resources = { name: StatsSnapshot._resource_info(resource) for name, resource in summary.resources.items() }
+        for container in containers:
+            resources[container.name] = StatsSnapshot._resource_info(container)
+        return StatsSnapshot(
+            now=summary.env.now if summary.env is not None else 0,
+            entities=StatsSnapshot._columns(StatsSnapshot.ENTITY_COLUMNS, [(entity.id, entity.creation_time, entity.disposal_time,
+                entity.total_time, entity.waiting_time, entity.processing_time) for entity in entities]),
+            visits=StatsSnapshot._columns(StatsSnapshot.VISIT_COLUMNS, visits),
+            attributes=[StatsSnapshot._plain_attributes(entity.attributes) for entity in entities],
+            resource_names=resource_names,
+            resources=resources,
+            group_by=summary.group_by,
+            streaming_summaries={ (name, StatsSnapshot._plain_value(group)): { kind: StatsSnapshot._copy_running_stat(stat)
+                for kind, stat in running_stats.items() } for (name, group), running_stats in summary.streaming_summaries.items() }
+        )
+
+    @staticmethod
+    def merge(snapshots):
+        """
+        combines snapshots of independent runs (or shards of one study) into a new snapshot
+        """
+        snapshots = list(snapshots)
+        if not snapshots:
+            raise Exception("Nothing to merge, pass at least one snapshot")
+        for snapshot in snapshots:
+            StatsSnapshot._check_version(snapshot.version)
+        if len({ snapshot.group_by for snapshot in snapshots }) > 1:
+            raise Exception("Only snapshots with the same group_by attributes can be merged")
+        if any(snapshot.streaming_summaries for snapshot in snapshots) and any(len(snapshot) for snapshot in snapshots):
+            raise Exception("Streaming and non streaming snapshots can't be merged")
+
+        resource_names = []
+        for snapshot in snapshots:
+            resource_names += [name for name in snapshot.resource_names if name not in resource_names]
+        resource_codes = { name: code for code, name in enumerate(resource_names) }
+
+        entities, visits, attributes, streaming_summaries = [], [], [], {}
+        resources = {}
+        offset, next_id = 0, 0
+        for snapshot in snapshots:
+            # entity ids are renumbered so every run gets its own range
+            ids = snapshot.entities["id"]
+            new_ids = np.arange(next_id, next_id + len(ids), dtype=np.int64)
+            entity_columns = dict(snapshot.entities, id=new_ids)
+            entity_columns["creation_time"] = entity_columns["creation_time"] + offset
+            entity_columns["disposal_time"] = entity_columns["disposal_time"] + offset
+            entities.append(entity_columns)
+            visit_columns = dict(snapshot.visits)
+            visit_columns["entity_id"] = new_ids[np.searchsorted(ids, snapshot.visits["entity_id"])]
+            codes = np.array([resource_codes[name] for name in snapshot.resource_names], dtype=np.int64)
+            visit_columns["resource"] = codes[snapshot.visits["resource"]]
+            for column in ("arrival_time", "start_service_time", "finish_service_time"):
+                visit_columns[column] = visit_columns[column] + offset
+            visits.append(visit_columns)
+            attributes += snapshot.attributes
+            for key, running_stats in snapshot.streaming_summaries.items():
+                merged = streaming_summaries.setdefault(key, { kind: RunningStat(stat.sketch.relative_accuracy)
+                    for kind, stat in running_stats.items() })
+                for kind, stat in running_stats.items():
+                    merged[kind].merge(stat)
+            for name, info in snapshot.resources.items():
+                resources.setdefault(name, []).append((offset, snapshot.now, info))
+            next_id += len(ids)
+            offset += snapshot.now
+
+        return StatsSnapshot(
+            now=offset,
+            entities={ column: np.concatenate([e[column] for e in entities]) for column in StatsSnapshot.ENTITY_COLUMNS },
+            visits={ column: np.concatenate([v[column] for v in visits]) for column in StatsSnapshot.VISIT_COLUMNS },
+            attributes=attributes,
+            resource_names=resource_names,
+            resources={ name: StatsSnapshot._merge_resource_info(parts, offset) for name, parts in resources.items() },
+            group_by=snapshots[0].group_by,
+            streaming_summaries=streaming_summaries,
+            runs=sum(snapshot.runs for snapshot in snapshots)
+        )
+
+    def restore(self):
+        """
+        rebuilds a Stats summary from the snapshot, and makes it the current summary so it can be queried as usual.
+        Resources are found in Stats.summary.resources by name.
+        """
+        summary = Stats(streaming=bool(self.streaming_summaries), group_by=self.group_by)
+        summary.classes_as_names = True
+        summary.env = SimpleNamespace(now=self.now)
+        summary.streaming_summaries = { key: { kind: StatsSnapshot._copy_running_stat(stat) for kind, stat in running_stats.items() }
+            for key, running_stats in self.streaming_summaries.items() }
+        entities = {}
+        for i, (entity_id, creation_time, disposal_time, total, waiting, processing) in enumerate(
+                zip(*[self.entities[column].tolist() for column in StatsSnapshot.ENTITY_COLUMNS])):
+            entity = Entity.__new__(Entity)
+            entity.env = summary.env
+            entity.id = entity_id
+            entity.attributes = dict(self.attributes[i])
+            entity.creation_time = creation_time
+            entity.disposal_time = disposal_time
+            entity.total_time = total
+            entity.waiting_time = waiting
+            entity.processing_time = processing
+            entity.visits = []
+            entities[entity_id] = entity
+        for entity_id, resource, arrival_time, start_service_time, finish_service_time in zip(
+                *[self.visits[column].tolist() for column in StatsSnapshot.VISIT_COLUMNS]):
+            visit = Visit(self.resource_names[resource], arrival_time)
+            visit.start_service_time = StatsSnapshot._none_if_nan(start_service_time)
+            visit.finish_service_time = StatsSnapshot._none_if_nan(finish_service_time)
+            entities[entity_id].visits.append(visit)
+        for entity in entities.values():
+            Stats._add_entity(entity)
+            entity.name = f"Entity {entity.id}"
+            for resource_name in entity.visited_resource_names():
+                Stats._add_visit(entity, resource_name)
+        for info in self.resources.values():
+            EventLog.register_event_names(info.get("event_names", {}))
+        summary.resources = { name: StoredResource(name, info, self.now, { log_name: EventLog.from_arrays(*columns)
+            for log_name, columns in info["event_logs"].items() }) for name, info in self.resources.items() }
+        return summary
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump({ "version": self.version, "snapshot": self.__dict__ }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        StatsSnapshot._check_version(saved["version"])
+        snapshot = StatsSnapshot.__new__(StatsSnapshot)
+        snapshot.__dict__.update(saved["snapshot"])
+        return snapshot
+
+    def __len__(self):
+        return len(self.entities["id"])
+
+    # private
+
+    @staticmethod
+    def _check_version(version):
+        if version > StatsSnapshot.VERSION:
+            raise Exception(f"Snapshot version {version} is newer than this version of simpy_helpers supports ({StatsSnapshot.VERSION})")
+
+    @staticmethod
+    def _plain_attributes(attributes):
+        attributes = { key: StatsSnapshot._plain_value(value) for key, value in attributes.items() }
+        return { key: value for key, value in attributes.items() if StatsSnapshot._is_plain(value) }
+
+    @staticmethod
+    def _plain_value(value):
+        # classes (e.g. the "type" attribute of every entity) are kept by name, so loading a snapshot never needs the model code
+        if isinstance(value, type):
+            return Stats._class_name(value)
+        if isinstance(value, tuple):
+            return tuple(StatsSnapshot._plain_value(item) for item in value)
+        if isinstance(value, frozenset):
+            return frozenset(StatsSnapshot._plain_value(item) for item in value)
+        return value
+
+    @staticmethod
+    def _is_plain(value):
+        if isinstance(value, (tuple, frozenset)):
+            return all(StatsSnapshot._is_plain(item) for item in value)
+        return isinstance(value, StatsSnapshot.PLAIN_TYPES)
+
+    @staticmethod
+    def _columns(names, rows):
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        return { name: np.array(column, dtype=np.int64 if name in ("id", "entity_id", "resource") else np.float64)
+            for name, column in zip(names, columns) }
+
+    @staticmethod
+    def _resource_info(resource):
+        return {
+            "capacity": resource.capacity,
+            "record_history": resource.record_history,
+            "event_logs": { log_name: (np.array(log.times), np.array(log.sizes), np.array(log.events))
+                for log_name in resource.EVENT_LOGS for log in [getattr(resource, log_name)] },
+            "time_weighted_stats": { stat_name: dict(vars(getattr(resource, stat_name))) for stat_name in resource.TIME_WEIGHTED_STATS },
+            # event codes of the logs, custom events get their codes in the order they were first recorded
+            "event_names": dict(EventLog.EVENT_NAMES)
+        }
+
+    @staticmethod
+    def _merge_resource_info(parts, now):
+        """
+        parts - (time offset, end time, info) of the resource in each run it appeared in
+        """
+        first = parts[0][2]
+        event_logs = {}
+        for log_name in first["event_logs"]:
+            logs = [(offset, info["event_logs"][log_name]) for offset, _, info in parts]
+            event_logs[log_name] = tuple(np.concatenate(columns) for columns in zip(*[(times + offset, sizes, events)
+                for offset, (times, sizes, events) in logs]))
+        time_weighted_stats = {}
+        for stat_name in first["time_weighted_stats"]:
+            stats = [(offset, end, info["time_weighted_stats"][stat_name]) for offset, end, info in parts]
+            stat = TimeWeightedStat(0)
+            # the merged stat covers the total time the resource existed, ending at now
+            area = sum(StatsSnapshot._restore_stat(state).integral_until(end) for _, end, state in stats)
+            duration = sum(end - state["start_time"] for _, end, state in stats)
+            stat.start_time = now - duration
+            stat.last_time = now
+            stat.last_value = stats[-1][2]["last_value"]
+            stat.integral = area
+            stat.minimum = min(state["minimum"] for _, _, state in stats)
+            stat.maximum = max(state["maximum"] for _, _, state in stats)
+            time_weighted_stats[stat_name] = vars(stat)
+        return {
+            "capacity": first["capacity"],
+            "record_history": all(info["record_history"] for _, _, info in parts),
+            "event_logs": event_logs,
+            "time_weighted_stats": time_weighted_stats,
+            "event_names": { code: name for _, _, info in parts for code, name in info.get("event_names", {}).items() }
+        }
+
+    @staticmethod
+    def _restore_stat(state):
+        stat = TimeWeightedStat.__new__(TimeWeightedStat)
+        stat.__dict__.update(state)
+        return stat
+
+    @staticmethod
+    def _copy_running_stat(stat):
+        return RunningStat(stat.sketch.relative_accuracy).merge(stat)
+
+    @staticmethod
+    def _nan_if_none(value):
+        return np.nan if value is None else value
+
+    @staticmethod
+    def _none_if_nan(value):
+        return None if value != value else value
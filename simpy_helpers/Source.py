@@ -1,43 +1,67 @@
+import numpy as np
 from .Debug import Debug
+from .Trace import Trace, PrintSink
 from .Stats import Stats
+from .Profiler import Profiler
+from .RandomStreams import RandomStreams
 
 class Source:
     """
     keeps track of entities that have been produced for simluation
+
+    Define either interarrival_time() returning one time, or interarrival_times(n) returning an array of n times.
+    interarrival_times is drawn in blocks of INTERARRIVAL_BATCH_SIZE, which is much cheaper for numpy distributions
+    e.g. np.random.exponential(5, size=n)
+    Draw from self.rng (e.g. self.rng.exponential(5, size=n)) to give the source its own random number stream.
+
+    Define batch_size() (optional) returning how many entities arrive together at each arrival, e.g. a bus of passengers.
+    A whole batch shares a single timeout event. number still counts entities, so the last batch may be cut short.
+
+    entity_pool - reuse disposed entities instead of building new ones. Build entities with self.new_entity(EntityClass, attributes)
+        in build_entity for this to take effect. Entities are only reused once Stats no longer keeps them,
+        i.e. in streaming mode or with a ResultStore, so don't hold on to entities yourself after they are disposed.
     """
-    def __init__(self, env, first_creation=None, number=float("Inf")):
-        if self.interarrival_time is None:
-            raise NotImplementedError("Provide a method named interarrival_time_generator on your Source Class")
+    INTERARRIVAL_BATCH_SIZE = 1024
+
+    def __init__(self, env, first_creation=None, number=float("Inf"), entity_pool=False):
+        if getattr(self, "interarrival_time", None) is None and getattr(self, "interarrival_times", None) is None:
+            raise NotImplementedError("Provide a method named interarrival_time (or interarrival_times) on your Source Class")
         self._interarrival_time_generator_template = self._interarrival_time_generator_factory() 
         self.env = env
         self.first_creation = first_creation
         self.number = number
         self.count = 0
+        self.entity_pool = entity_pool
+        self._pool = {}
     
     def next_entity(self):
-        for time in self._interarrival_time_generator():
-            self.count += 1
-            if self.count > self.number:
-                # we've reached the number we need to source
-                # They will finish processing before simulation ends
-                break 
-            timeout = self.env.timeout(time)
-            creation_time = self.env.now + time
-            entity = self.build_entity()
-            entity.creation_time = creation_time
-            entity.name = f"{entity.__class__.__name__} {self.count}"
-            entity.attributes["type"] = entity.__class__ # useful for filtering later
-            Stats._add_entity(entity)
-            yield timeout, entity        
+        for timeout, entities in self._next_arrivals():
+            for entity in entities:
+                yield timeout, entity
     
     def start(self, debug=False):
         self._configure_debug(debug)
         self._initialize_stats()
-        for arrival_time, entity in self.next_entity():
-            yield arrival_time # wait for the next entity to appear
-            Debug.info(entity)
-            p = self.env.process(entity.process())
-            p.callbacks.append(self._dispose(entity)) # disposal happens automatically
+        for arrival_time, entities in self._next_arrivals():
+            yield arrival_time # wait for the next entities to appear
+            for entity in entities:
+                if Trace.ENABLED:
+                    Trace.event(self.env.now, "arrive", entity)
+                Stats._arrive_entity(entity)
+                p = self.env.process(entity.process())
+                p.callbacks.append(self._dispose(entity)) # disposal happens automatically
+
+    def new_entity(self, entity_class, attributes=None, *args, **kwargs):
+        """
+        entity_class(self.env, attributes, *args, **kwargs), or a disposed entity_class entity set up again with
+        the same arguments when entity_pool is on and one is available
+        """
+        pool = self._pool.get(entity_class)
+        if pool:
+            entity = pool.pop()
+            entity._recycle(self.env, attributes, *args, **kwargs)
+            return entity
+        return entity_class(self.env, attributes, *args, **kwargs)
     
     def get_build_count(self):
         """
@@ -47,31 +71,98 @@ class Source:
     
     def now(self):
         return self.env.now
+
+    @property
+    def rng(self):
+        """
+        this source's own RandomStream, see RandomStreams
+        """
+        if getattr(self, "_rng", None) is None:
+            self._rng = RandomStreams.for_env(self.env).stream(self.__class__.__name__)
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng):
+        # any generator with the numpy distribution methods can be used instead
+        self._rng = rng
     
     # private methods
+
+    def _next_arrivals(self):
+        """
+        yields the timeout of each arrival, with the list of entities arriving then
+        """
+        batched = getattr(self, "batch_size", None) is not None
+        for time in self._interarrival_time_generator():
+            if self.count >= self.number:
+                # we've reached the number we need to source
+                # They will finish processing before simulation ends
+                self.count += 1
+                break
+            timeout = self.env.timeout(time)
+            creation_time = self.env.now + time
+            size = int(self._call_user_function(self.batch_size)) if batched else 1
+            entities = []
+            for _ in range(size):
+                if self.count >= self.number:
+                    break
+                self.count += 1
+                entities.append(self._build_entity(creation_time))
+            yield timeout, entities
+
+    def _build_entity(self, creation_time):
+        if Profiler.ENABLED:
+            entity = Profiler.timed(self.__class__.__name__, "build_entity", self.build_entity)
+            Profiler.count(entity.__class__.__name__, "created")
+        else:
+            entity = self.build_entity()
+        entity.creation_time = creation_time
+        entity.name = f"{entity.__class__.__name__} {self.count}"
+        entity.attributes["type"] = entity.__class__ # useful for filtering later
+        Stats._add_entity(entity)
+        return entity
     
     def _initialize_stats(self):
-        Stats()
+        Stats._summary_for_env(self.env)
     
     def _configure_debug(self, debug):
         Debug.DEBUG = debug
         if Debug.DEBUG:
             print("Debug is Enabled")
+            Trace.configure(PrintSink())
+        elif isinstance(Trace.sink, PrintSink):
+            # turn off printing left over from a previous debug run, other sinks are configured by the user
+            Trace.disable()
     
     def _interarrival_time_generator(self):
         # if first_creation exists, emit it as the first time, else just use the interarrival_time
         if self.first_creation is not None:
             yield self.first_creation
-        for time in self._interarrival_time_generator_template:
-            yield time
+        yield from self._interarrival_time_generator_template
     
     def _interarrival_time_generator_factory(self):
+        if getattr(self, "interarrival_times", None) is not None:
+            while True:
+                yield from np.asarray(self._call_user_function(self.interarrival_times, self.INTERARRIVAL_BATCH_SIZE)).tolist()
         while True:
-            yield self.interarrival_time()
+            yield self._call_user_function(self.interarrival_time)
+    
+    def _call_user_function(self, function, *args):
+        if Profiler.ENABLED:
+            return Profiler.timed(self.__class__.__name__, function.__name__, function, *args)
+        return function(*args)
     
     def _dispose(self, entity):
         """
         This is used to append dispose to the end of the entity.process callback list
         It needs to be a lambda. 
         """
-        return lambda _: (entity.dispose())
\ No newline at end of file
+        if self.entity_pool:
+            return lambda _: self._dispose_to_pool(entity)
+        return lambda _: (entity.dispose())
+
+    def _dispose_to_pool(self, entity):
+        entity.dispose()
+        if Stats._summary_tracking(entity) is None:
+            # stats didn't keep the entity (streaming mode or a ResultStore), so it can be reused
+            self._pool.setdefault(entity.__class__, []).append(entity)
\ No newline at end of file
@@ -1,13 +1,89 @@
-class Stats:
+import threading
+import numpy as np
+from .RunningStat import RunningStat
+from .ResultStore import ResultStore
+from .Profiler import Profiler
+from .Table import StatsTable
+
+class _StatsMeta(type):
+    """
+    Makes Stats.summary thread local, so simulations running in different threads each get their own stats context
+    """
+    _local = threading.local()
+
+    @property
+    def summary(cls):
+        return getattr(_StatsMeta._local, "summary", None)
+
+    @summary.setter
+    def summary(cls, value):
+        _StatsMeta._local.summary = value
+
+class Stats(metaclass=_StatsMeta):
     """
     Tracks both entities and resources so we can query for summary statistics at the end of the simulation.
-    This is reset when Source.start() is called
+    This is reset when Source.start() is called for a new simulation environment.
+    Stats.summary is the current summary for the calling thread.
+
+    Streaming mode keeps memory bounded for long runs. Create the summary yourself before running the simulation:
+        Stats(env, streaming=True, group_by=["type", "priority"])
+    When an entity is disposed its times are folded into RunningStat accumulators (per resource and per group of the
+    group_by attributes) and the entity is dropped. Queries for disposed entities then return a RunningStat instead of a list,
+    and may only filter on group_by attributes. Entities that haven't been disposed are still kept and queried as usual.
+
+    With a ResultStore, Stats(env, result_store=store), disposed entities are written to the store instead of being kept in memory.
+    Queries for disposed entities then read the store and return NumPy arrays (ordered by entity, like the lists).
+    Numeric attribute values are matched as numbers, others by their string form. Use Stats.open(path) to query a store after the run.
+
+    Stats(env, profile=True) turns on the Profiler for this run, read the report with Stats.profile() afterwards.
+    Stats.to_table() exports the visits of disposed entities as a StatsTable, for grouped analysis in vectorized code.
     """
-    summary = None
-    def __init__(self):
-        self.entities = []
+    # columns of the tables entities are written to when using a ResultStore
+    ENTITY_COLUMNS = { "entity_id": np.int64, "creation_time": np.float64, "disposal_time": np.float64,
+        "total": np.float64, "waiting": np.float64, "processing": np.float64 }
+    VISIT_COLUMNS = { "entity_id": np.int64, "resource": np.int32, "arrival_time": np.float64,
+        "start_service_time": np.float64, "finish_service_time": np.float64 }
+    ATTRIBUTE_COLUMNS = { "entity_id": np.int64, "key": np.int32, "value": np.int32, "number": np.float64 }
+
+    def __init__(self, env=None, streaming=False, group_by=(), result_store=None, profile=False):
+        self.env = env
         self.resources = {}
+        self.result_store = result_store
+        self.streaming = streaming
+        self.group_by = tuple(group_by)
+        self.streaming_summaries = {}
+        # entities that have arrived in / left the system, so work in process is known without scanning entities
+        self.entities_arrived = 0
+        self.entities_disposed = 0
+        # called with every disposed entity, before it is stored or folded away (see Sampler)
+        self.dispose_listeners = []
+        # entities are stored by id, and indexed by attribute (key, value) and by visited resource name
+        # so that filtered queries only touch the entities that match
+        self._entities = {}
+        self._next_entity_id = 0
+        self._attribute_index = {}
+        self._unindexed_attributes = set()
+        self._resource_index = {}
+        # set on summaries restored from a StatsSnapshot, where classes are stored by name (see Stats._class_name)
+        self.classes_as_names = False
+        self.profiler = Profiler(env) if profile else None
+        Profiler.activate(self.profiler)
         Stats.summary = self
+
+    @property
+    def entities(self):
+        return list(self._entities.values())
+
+    @staticmethod
+    def open(path):
+        """
+        reopens the results saved by a ResultStore, and makes them the current summary so they can be queried as usual.
+        Stored resources are found in Stats.summary.resources by name.
+        """
+        store = ResultStore.open(path)
+        summary = Stats(result_store=store)
+        summary.resources = store.stored_resources()
+        return summary
     
     # Entity Stats Methods
     
@@ -19,6 +95,10 @@ class Stats:
     @staticmethod
     def get_total_times(resource=None, attributes={}):
         Stats._check_for_instance_or_raise()
+        if Stats.summary._is_stored_query(attributes):
+            return Stats.summary._get_stored_times("total", resource, attributes)
+        if Stats.summary._is_streaming_query(attributes):
+            return Stats.summary._get_streamed_times("total", resource, attributes)
         if resource is not None:
             return Stats.summary._get_total_times_for_resource(resource, attributes)
         filtered_entities = Stats.summary._filter_entities(attributes)
@@ -27,6 +107,10 @@ class Stats:
     @staticmethod
     def get_waiting_times(resource=None, attributes={}):
         Stats._check_for_instance_or_raise()
+        if Stats.summary._is_stored_query(attributes):
+            return Stats.summary._get_stored_times("waiting", resource, attributes)
+        if Stats.summary._is_streaming_query(attributes):
+            return Stats.summary._get_streamed_times("waiting", resource, attributes)
         
         if resource is not None:
             return Stats.summary._get_waiting_times_for_resource(resource, attributes)
@@ -37,6 +121,10 @@ class Stats:
     @staticmethod
     def get_processing_times(resource=None, attributes={}):
         Stats._check_for_instance_or_raise()
+        if Stats.summary._is_stored_query(attributes):
+            return Stats.summary._get_stored_times("processing", resource, attributes)
+        if Stats.summary._is_streaming_query(attributes):
+            return Stats.summary._get_streamed_times("processing", resource, attributes)
         
         if resource is not None:
             return Stats.summary._get_processing_times_for_resource(resource, attributes)
@@ -44,6 +132,14 @@ class Stats:
         filtered_entities = Stats.summary._filter_entities(attributes)
         return [entity.get_total_processing_time() for entity in filtered_entities]
     
+    @staticmethod
+    def to_table():
+        """
+        StatsTable with one row per visit of a disposed entity to a resource, and a column per entity attribute
+        """
+        Stats._check_for_instance_or_raise()
+        return StatsTable.from_summary(Stats.summary)
+
     @staticmethod
     def queue_size_over_time(resource, sample_frequency=1):
         Stats._check_for_instance_or_raise()
@@ -78,6 +174,55 @@ class Stats:
     def container_level_over_time(container, sample_frequency=1):
         Stats._check_for_instance_or_raise()
         return container.level_over_time(sample_frequency)
+
+    # Time Weighted Resource Stats Methods
+    # These are exact and read running integrals kept by the resource, so they don't depend on the event history
+
+    @staticmethod
+    def time_average_queue_length(resource):
+        Stats._check_for_instance_or_raise()
+        return Stats._tracked_resource(resource).time_average_queue_length()
+
+    @staticmethod
+    def time_average_utilization(resource):
+        Stats._check_for_instance_or_raise()
+        return Stats._tracked_resource(resource).time_average_utilization()
+
+    @staticmethod
+    def time_average_number_being_processed(resource):
+        Stats._check_for_instance_or_raise()
+        return Stats._tracked_resource(resource).time_average_number_being_processed()
+
+    @staticmethod
+    def max_queue_length(resource):
+        Stats._check_for_instance_or_raise()
+        return Stats._tracked_resource(resource).queue_length_stat.maximum
+
+    @staticmethod
+    def time_average_container_level(container):
+        Stats._check_for_instance_or_raise()
+        return container.time_average_level()
+
+    @staticmethod
+    def container_level_range(container):
+        """
+        returns the (minimum, maximum) level the container reached
+        """
+        Stats._check_for_instance_or_raise()
+        return container.level_stat.minimum, container.level_stat.maximum
+
+    # Profiling
+
+    @staticmethod
+    def profile():
+        """
+        report of where the run spent its time: simpy events processed per wall clock second,
+        wall clock time spent in user callbacks, and request / release / put / get counts and peak queue length per component
+        """
+        Stats._check_for_instance_or_raise()
+        if Stats.summary.profiler is None:
+            raise Exception("Profiling is turned off, create the summary with Stats(env, profile=True) before running the simulation")
+        return Stats.summary.profiler.report(Stats.summary.resources)
         
     
     @staticmethod
@@ -86,10 +231,74 @@ class Stats:
         if not resource_name in Stats.summary.resources:
             Stats.summary.resources[resource.name] = resource
     
+    @staticmethod
+    def _tracked_resource(resource):
+        # falls back to the resource itself if it wasn't visited, its stats are all zeros in that case
+        return Stats.summary.resources.get(resource.name, resource)
+
     @staticmethod
     def _add_entity(entity):
-        Stats.summary.entities.append(entity)
+        summary = Stats.summary
+        entity.id = summary._next_entity_id
+        summary._next_entity_id += 1
+        summary._entities[entity.id] = entity
+        for key, value in entity.attributes.items():
+            summary._index_attribute(entity.id, key, value)
+
+    @staticmethod
+    def _set_entity_attribute(entity, key, value):
+        """
+        keeps the attribute index in sync, called by Entity.set_attribute before the attribute is changed
+        """
+        summary = Stats._summary_tracking(entity)
+        if summary is None:
+            return
+        if key in entity.attributes:
+            summary._unindex_attribute(entity.id, key, entity.attributes[key])
+        summary._index_attribute(entity.id, key, value)
+
+    @staticmethod
+    def _add_visit(entity, resource_name):
+        summary = Stats._summary_tracking(entity)
+        if summary is not None:
+            summary._resource_index.setdefault(resource_name, set()).add(entity.id)
     
+    @staticmethod
+    def _summary_for_env(env):
+        # sources (and samplers) sharing an environment share its stats, a new environment gets a fresh summary
+        if Stats.summary is None or Stats.summary.env is not env:
+            Stats(env)
+        return Stats.summary
+
+    @staticmethod
+    def _arrive_entity(entity):
+        summary = Stats._summary_tracking(entity)
+        if summary is not None:
+            summary.entities_arrived += 1
+
+    @staticmethod
+    def _dispose_entity(entity):
+        summary = Stats._summary_tracking(entity)
+        if summary is None:
+            return
+        summary.entities_disposed += 1
+        for listener in summary.dispose_listeners:
+            listener(entity)
+        if summary.result_store is not None:
+            summary._store_entity(entity)
+            summary._remove_entity(entity)
+        elif summary.streaming:
+            summary._fold_entity(entity)
+            summary._remove_entity(entity)
+
+    @staticmethod
+    def _summary_tracking(entity):
+        # entities built outside of a Source (or in another simulation) aren't tracked by the current summary
+        summary = Stats.summary
+        if summary is None or summary._entities.get(entity.id) is not entity:
+            return None
+        return summary
+
     @staticmethod
     def _check_for_instance_or_raise():
         if Stats.summary is None:
@@ -101,27 +310,205 @@ class Stats:
             return [entity for entity in entities if entity.matches_attributes(attributes)]
         return entities
     
-    def _filter_entities(self, attributes={}):
+    def _filter_entities(self, attributes={}, resource_name=None):
+        attributes = self._query_attributes(attributes)
         if "disposed" not in attributes:
             # default is that we filter for only disposed entities. This can be overridden
             attributes["disposed"] = True
-        return Stats._filter_entities_on_matched_attributes(self.entities, attributes)
+        candidates = []
+        if resource_name is not None:
+            candidates.append(self._resource_index.get(resource_name, set()))
+        unindexed = {}
+        for key, value in attributes.items():
+            if key in self._unindexed_attributes or not Stats._is_hashable(value):
+                unindexed[key] = value
+            else:
+                candidates.append(self._attribute_index.get((key, value), set()))
+        if candidates:
+            candidates.sort(key=len)
+            entity_ids = set(candidates[0]).intersection(*candidates[1:])
+            entities = [self._entities[entity_id] for entity_id in sorted(entity_ids)]
+        else:
+            entities = list(self._entities.values())
+        return Stats._filter_entities_on_matched_attributes(entities, unindexed)
 
     def _get_waiting_times_for_resource(self, resource, attributes={}):
-        filtered_entities = self._filter_entities(attributes)
-        waiting_times = [entity.get_waiting_time_for_resource(resource) for entity in filtered_entities]
-        return [time for time in waiting_times if time is not None]
+        filtered_entities = self._filter_entities(attributes, resource.name)
+        return [entity.get_waiting_time_for_resource(resource) for entity in filtered_entities]
     
     def _get_processing_times_for_resource(self, resource, attributes={}):
-        filtered_entities = self._filter_entities(attributes)
-        processing_times = [entity.get_processing_time_for_resource(resource) for entity in filtered_entities]
-        return [time for time in processing_times if time is not None]
+        filtered_entities = self._filter_entities(attributes, resource.name)
+        return [entity.get_processing_time_for_resource(resource) for entity in filtered_entities]
     
     def _get_total_times_for_resource(self, resource, attributes={}):
-        filtered_entities = self._filter_entities(attributes)
-        waiting_times = self._get_waiting_times_for_resource(resource, attributes)
-        processing_times = self._get_processing_times_for_resource(resource, attributes)
-        return [t1 + t2 for t1, t2 in zip(waiting_times, processing_times)]
+        filtered_entities = self._filter_entities(attributes, resource.name)
+        return [entity.get_waiting_time_for_resource(resource) + entity.get_processing_time_for_resource(resource) for entity in filtered_entities]
     
     def _get_disposed_entities(self):
-        return [entity for entity in Stats.summary.entities if entity.is_disposed()]
\ No newline at end of file
+        return self._filter_entities({"disposed": True})
+
+    def _query_attributes(self, attributes):
+        if not self.classes_as_names:
+            return dict(attributes)
+        return { key: Stats._class_name(value) if isinstance(value, type) else value for key, value in attributes.items() }
+
+    @staticmethod
+    def _class_name(cls):
+        return f"{cls.__module__}.{cls.__qualname__}"
+
+    # attribute index
+
+    @staticmethod
+    def _is_hashable(value):
+        try:
+            hash(value)
+        except TypeError:
+            return False
+        return True
+
+    def _index_attribute(self, entity_id, key, value):
+        if not Stats._is_hashable(value):
+            # can't index this attribute, queries on it fall back to checking each candidate entity
+            self._unindexed_attributes.add(key)
+            return
+        self._attribute_index.setdefault((key, value), set()).add(entity_id)
+
+    def _unindex_attribute(self, entity_id, key, value):
+        if Stats._is_hashable(value):
+            Stats._discard_from_index(self._attribute_index, (key, value), entity_id)
+
+    def _remove_entity(self, entity):
+        for key, value in entity.attributes.items():
+            self._unindex_attribute(entity.id, key, value)
+        for resource_name in entity.visited_resource_names():
+            Stats._discard_from_index(self._resource_index, resource_name, entity.id)
+        del self._entities[entity.id]
+
+    @staticmethod
+    def _discard_from_index(index, key, entity_id):
+        # empty sets are dropped, otherwise every distinct value ever seen (e.g. an order id) would stay in the index
+        entity_ids = index.get(key)
+        if entity_ids is not None:
+            entity_ids.discard(entity_id)
+            if not entity_ids:
+                del index[key]
+
+    # streaming mode
+
+    def _is_streaming_query(self, attributes):
+        return self.streaming and attributes.get("disposed", True) is True
+
+    def _group_key(self, attributes):
+        return tuple(attributes.get(attribute) for attribute in self.group_by)
+
+    def _running_stats(self, resource_name, group):
+        key = (resource_name, group)
+        if key not in self.streaming_summaries:
+            self.streaming_summaries[key] = { "total": RunningStat(), "waiting": RunningStat(), "processing": RunningStat() }
+        return self.streaming_summaries[key]
+
+    def _fold_entity(self, entity):
+        group = self._group_key(entity.attributes)
+        running_stats = self._running_stats(None, group)
+        running_stats["total"].add(entity.get_total_time())
+        running_stats["waiting"].add(entity.get_total_waiting_time())
+        running_stats["processing"].add(entity.get_total_processing_time())
+        for resource_name in entity.visited_resource_names():
+            waiting_time = entity._calculate_waiting_time_for_resource(resource_name)
+            processing_time = entity._calculate_processing_time_for_resource(resource_name)
+            running_stats = self._running_stats(resource_name, group)
+            running_stats["total"].add(waiting_time + processing_time)
+            running_stats["waiting"].add(waiting_time)
+            running_stats["processing"].add(processing_time)
+
+    def _get_streamed_times(self, kind, resource, attributes):
+        attributes = self._query_attributes(attributes)
+        resource_name = resource.name if resource is not None else None
+        filters = {self.group_by.index(k): v for k, v in attributes.items() if k != "disposed" and k in self.group_by}
+        unknown = [k for k in attributes if k != "disposed" and k not in self.group_by]
+        if unknown:
+            raise Exception(f"Streaming stats can only filter on the group_by attributes {list(self.group_by)}, not {unknown}")
+        result = RunningStat()
+        for (name, group), running_stats in self.streaming_summaries.items():
+            if name == resource_name and all(group[i] == v for i, v in filters.items()):
+                result.merge(running_stats[kind])
+        return result
+
+    # result store
+
+    def _is_stored_query(self, attributes):
+        return self.result_store is not None and attributes.get("disposed", True) is True
+
+    def _store_table(self, name, columns):
+        return self.result_store.table(name, columns)
+
+    def _store_entity(self, entity):
+        store = self.result_store
+        self._store_table("entities", Stats.ENTITY_COLUMNS).append(entity.id, entity.creation_time, entity.disposal_time,
+            entity.get_total_time(), entity.get_total_waiting_time(), entity.get_total_processing_time())
+        attributes = self._store_table("attributes", Stats.ATTRIBUTE_COLUMNS)
+        for key, value in entity.attributes.items():
+            if key == "disposed" or key in store.excluded_attributes:
+                continue
+            if ResultStore.is_number(value):
+                attributes.append(entity.id, store.category_code("attribute_keys", key), ResultStore.NUMBER_CODE, value)
+            else:
+                attributes.append(entity.id, store.category_code("attribute_keys", key), store.category_code("attribute_values", value), np.nan)
+        visits = self._store_table("visits", Stats.VISIT_COLUMNS)
+        for visit in entity.visits:
+            visits.append(entity.id, store.category_code("resources", visit.resource_name), visit.arrival_time,
+                np.nan if visit.start_service_time is None else visit.start_service_time,
+                np.nan if visit.finish_service_time is None else visit.finish_service_time)
+
+    def _stored_entity_ids(self, attributes):
+        """
+        ids of the stored entities matching attributes, None if there is nothing to filter on
+        """
+        store = self.result_store
+        filters = {k: v for k, v in attributes.items() if k != "disposed"}
+        if not filters:
+            return None
+        table = self._store_table("attributes", Stats.ATTRIBUTE_COLUMNS)
+        entity_ids, keys, values = table.column("entity_id"), table.column("key"), table.column("value")
+        matching = None
+        for key, value in filters.items():
+            key_code = store.lookup_category_code("attribute_keys", key)
+            if key_code is None:
+                return np.empty(0, dtype=np.int64)
+            if ResultStore.is_number(value):
+                found = entity_ids[(keys == key_code) & (values == ResultStore.NUMBER_CODE) & (table.column("number") == value)]
+            else:
+                value_code = store.lookup_category_code("attribute_values", value)
+                if value_code is None:
+                    return np.empty(0, dtype=np.int64)
+                found = entity_ids[(keys == key_code) & (values == value_code)]
+            matching = found if matching is None else np.intersect1d(matching, found)
+        return matching
+
+    def _get_stored_times(self, kind, resource, attributes):
+        entity_ids = self._stored_entity_ids(attributes)
+        if resource is None:
+            table = self._store_table("entities", Stats.ENTITY_COLUMNS)
+            ids, times = table.column("entity_id"), table.column(kind)
+            if entity_ids is not None:
+                mask = np.isin(ids, entity_ids)
+                ids, times = ids[mask], times[mask]
+            return np.asarray(times[np.argsort(ids, kind="stable")])
+
+        resource_code = self.result_store.lookup_category_code("resources", resource.name)
+        if resource_code is None:
+            return np.empty(0, dtype=np.float64)
+        table = self._store_table("visits", Stats.VISIT_COLUMNS)
+        ids = table.column("entity_id")
+        mask = table.column("resource") == resource_code
+        if entity_ids is not None:
+            mask &= np.isin(ids, entity_ids)
+        arrival_times = table.column("arrival_time")[mask]
+        start_service_times = table.column("start_service_time")[mask]
+        finish_service_times = table.column("finish_service_time")[mask]
+        waiting = np.where(np.isnan(start_service_times), 0, start_service_times - arrival_times)
+        processing = np.where(np.isnan(start_service_times) | np.isnan(finish_service_times), 0, finish_service_times - start_service_times)
+        times = { "waiting": waiting, "processing": processing, "total": waiting + processing }[kind]
+        # an entity can visit a resource more than once, sum its visits like the in memory queries do
+        unique_ids, entity_index = np.unique(ids[mask], return_inverse=True)
+        return np.bincount(entity_index, weights=times, minlength=len(unique_ids))
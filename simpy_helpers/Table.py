@@ -0,0 +1,283 @@
+import numpy as np
+from .ResultStore import ResultStore
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+class StatsTable:
+    """
+    Tidy columnar view of a Stats summary: one row per visit of a disposed entity to a resource, one NumPy array per column.
+
+        table = Stats.to_table()
+        table.mean("waiting", by=("resource", "type", "priority"))     # { (resource, type, priority): mean waiting time }
+        table.percentile("total", [50, 95], by="resource")
+        table.throughput()                                              # services completed per unit of time at each resource
+        table.to_records()                                              # NumPy structured array
+        table.to_dataframe()                                            # pandas DataFrame, if pandas is installed
+
+    The VISIT_COLUMNS come first, then a column per entity attribute (None where an entity doesn't have it).
+    Attributes named like one of the VISIT_COLUMNS get the column f"attributes.{name}".
+    waiting / processing / total are the times of the visit itself (nan if the visit never started or finished),
+    so means are per visit: an entity visiting a resource twice counts twice, unlike Stats.get_waiting_times.
+    Tables of a ResultStore are built from its columns directly, non numeric attribute values are strings (see ResultStore).
+    Entities folded away in streaming mode have no visits left to tabulate.
+    """
+    VISIT_COLUMNS = ("entity_id", "resource", "arrival_time", "start_service_time", "finish_service_time",
+        "waiting", "processing", "total", "creation_time", "disposal_time")
+    # columns with the same value on every visit of an entity
+    ENTITY_TIME_COLUMNS = ("creation_time", "disposal_time")
+
+    def __init__(self, columns, now=0):
+        """
+        columns - { name: array }, every array the same length
+        now - the time the run ended, the default end of the throughput window
+        """
+        self.columns = columns
+        self.now = now
+
+    @staticmethod
+    def from_summary(summary):
+        if summary.result_store is not None:
+            columns = StatsTable._stored_columns(summary.result_store)
+        elif summary.streaming:
+            raise Exception("Streaming stats don't keep disposed entities, run without streaming=True or with a ResultStore to build a table")
+        else:
+            columns = StatsTable._entity_columns(summary._get_disposed_entities())
+        now = summary.env.now if summary.env is not None else summary.result_store.now
+        return StatsTable(columns, now)
+
+    def __len__(self):
+        return len(self.columns["entity_id"])
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def to_records(self):
+        return np.rec.fromarrays(list(self.columns.values()), names=list(self.columns))
+
+    def to_dataframe(self):
+        if pandas is None:
+            raise Exception("pandas is not installed, use to_records() for a NumPy structured array instead")
+        return pandas.DataFrame(self.columns)
+
+    # grouped statistics, each returns { group: value } or a single value if by is empty.
+    # by is a column name or a tuple of them, groups are values or tuples of values to match
+
+    def count(self, by=()):
+        if not StatsTable._by_columns(by):
+            return len(self)
+        groups, keys = self._groups(by)
+        return self._by_group(keys, np.bincount(groups, minlength=len(keys)), by)
+
+    def mean(self, column, by=()):
+        """
+        mean of column per group, nan values (e.g. visits that never started) are left out
+        """
+        values, groups, keys = self._values(column, by)
+        counts = np.bincount(groups, minlength=len(keys))
+        totals = np.bincount(groups, weights=values, minlength=len(keys))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._by_group(keys, totals / counts, by)
+
+    def percentile(self, column, q, by=()):
+        """
+        q-th percentile(s) of column per group, interpolated like np.percentile. q is in percent, a number or a list
+        """
+        values, groups, keys = self._values(column, by)
+        order = np.lexsort((values, groups))
+        values = values[order]
+        counts = np.bincount(groups, minlength=len(keys))
+        starts = np.cumsum(counts) - counts
+        quantiles = np.atleast_1d(np.asarray(q, dtype=np.float64)) / 100.0
+        if np.any((quantiles < 0) | (quantiles > 1)):
+            raise ValueError(f"Percentiles must be between 0 and 100, got {q}")
+        # position of each quantile in every group's sorted values, one row per group
+        positions = starts[:, None] + quantiles[None, :] * np.maximum(counts - 1, 0)[:, None]
+        below = np.floor(positions).astype(np.int64)
+        above = np.ceil(positions).astype(np.int64)
+        result = np.full(positions.shape, np.nan)
+        has_values = counts > 0
+        if np.any(has_values):
+            fraction = positions[has_values] - below[has_values]
+            result[has_values] = values[below[has_values]] * (1 - fraction) + values[above[has_values]] * fraction
+        if np.ndim(q) == 0:
+            result = result[:, 0]
+        return self._by_group(keys, result, by)
+
+    def throughput(self, by="resource", time_column="finish_service_time", start=0, end=None):
+        """
+        rows whose time_column falls in [start, end] per unit of time, end defaults to the end of the run.
+        The default is the services completed per unit of time at each resource.
+        Entity time columns count each entity once per group, e.g. throughput(by="type", time_column="disposal_time")
+        is the number of entities of each type leaving the system per unit of time
+        """
+        end = self.now if end is None else end
+        if not end > start:
+            raise ValueError(f"The throughput window must end after it starts, got {start} to {end}")
+        groups, keys = self._groups(by)
+        times = np.asarray(self.columns[time_column], dtype=np.float64)
+        in_window = (times >= start) & (times <= end)
+        groups = groups[in_window]
+        if time_column in StatsTable.ENTITY_TIME_COLUMNS:
+            entity_ids = self.columns["entity_id"][in_window]
+            groups = np.unique(np.stack([groups, entity_ids]), axis=1)[0] if len(groups) else groups
+        return self._by_group(keys, np.bincount(groups, minlength=len(keys)) / float(end - start), by)
+
+    # private
+
+    @staticmethod
+    def _entity_columns(entities):
+        entity_ids, resources, arrival_times, start_service_times, finish_service_times = [], [], [], [], []
+        creation_times, disposal_times = [], []
+        attributes = {}
+        for entity in entities:
+            attribute_items = [(key, value) for key, value in entity.attributes.items() if key != "disposed"]
+            for visit in entity.visits:
+                row = len(entity_ids)
+                entity_ids.append(entity.id)
+                resources.append(visit.resource_name)
+                arrival_times.append(visit.arrival_time)
+                start_service_times.append(np.nan if visit.start_service_time is None else visit.start_service_time)
+                finish_service_times.append(np.nan if visit.finish_service_time is None else visit.finish_service_time)
+                creation_times.append(entity.creation_time)
+                disposal_times.append(entity.disposal_time)
+                for key, value in attribute_items:
+                    if key not in attributes:
+                        # attributes first seen on a later entity are missing (None) for the rows before it
+                        attributes[key] = [None] * row
+                    attributes[key].append(value)
+                for values in attributes.values():
+                    if len(values) == row:
+                        values.append(None)
+        return StatsTable._columns(np.asarray(entity_ids, dtype=np.int64), np.asarray(resources, dtype=str),
+            np.asarray(arrival_times, dtype=np.float64), np.asarray(start_service_times, dtype=np.float64),
+            np.asarray(finish_service_times, dtype=np.float64), np.asarray(creation_times, dtype=np.float64),
+            np.asarray(disposal_times, dtype=np.float64), attributes)
+
+    @staticmethod
+    def _stored_columns(store):
+        visits = store.tables.get("visits")
+        if visits is None:
+            return StatsTable._entity_columns([])
+        # rows are stored in the order entities were disposed, the table is ordered by entity like the in memory one
+        entity_ids = visits.column("entity_id")
+        order = np.argsort(entity_ids, kind="stable")
+        entity_ids = np.asarray(entity_ids[order])
+        resource_names = np.asarray(store.categories.get("resources", []), dtype=str)
+        entities = store.tables["entities"]
+        stored_ids = entities.column("entity_id")
+        stored_order = np.argsort(stored_ids)
+        entity_rows = stored_order[np.searchsorted(stored_ids[stored_order], entity_ids)]
+
+        attributes = {}
+        attribute_table = store.tables.get("attributes")
+        if attribute_table is not None and len(attribute_table):
+            keys, values = attribute_table.column("key"), attribute_table.column("value")
+            numbers = attribute_table.column("number")
+            attribute_ids = attribute_table.column("entity_id")
+            # numeric values have no name, the extra None keeps their NUMBER_CODE (-1) a valid index
+            value_names = np.asarray(store.categories.get("attribute_values", []) + [None], dtype=object)
+            for code, key in enumerate(store.categories.get("attribute_keys", [])):
+                rows = keys == code
+                is_number = values[rows] == ResultStore.NUMBER_CODE
+                key_values = np.where(is_number, numbers[rows].astype(object), value_names[values[rows]])
+                ids = attribute_ids[rows]
+                id_order = np.argsort(ids)
+                ids, key_values = ids[id_order], key_values[id_order]
+                positions = np.minimum(np.searchsorted(ids, entity_ids), max(len(ids) - 1, 0))
+                found = ids[positions] == entity_ids if len(ids) else np.zeros(len(entity_ids), dtype=bool)
+                column = np.full(len(entity_ids), None, dtype=object)
+                column[found] = key_values[positions[found]]
+                attributes[key] = column
+
+        return StatsTable._columns(entity_ids, resource_names[visits.column("resource")[order]],
+            np.asarray(visits.column("arrival_time")[order]), np.asarray(visits.column("start_service_time")[order]),
+            np.asarray(visits.column("finish_service_time")[order]), np.asarray(entities.column("creation_time")[entity_rows]),
+            np.asarray(entities.column("disposal_time")[entity_rows]), attributes)
+
+    @staticmethod
+    def _columns(entity_id, resource, arrival_time, start_service_time, finish_service_time, creation_time, disposal_time, attributes):
+        columns = {
+            "entity_id": entity_id,
+            "resource": resource,
+            "arrival_time": arrival_time,
+            "start_service_time": start_service_time,
+            "finish_service_time": finish_service_time,
+            "waiting": start_service_time - arrival_time,
+            "processing": finish_service_time - start_service_time,
+            "total": finish_service_time - arrival_time,
+            "creation_time": creation_time,
+            "disposal_time": disposal_time
+        }
+        for key, values in attributes.items():
+            name = f"attributes.{key}" if key in columns else key
+            columns[name] = StatsTable._column(values)
+        return columns
+
+    @staticmethod
+    def _column(values):
+        """
+        numeric or string array when every value is a number / every value is a string, an object array otherwise
+        """
+        column = np.empty(len(values), dtype=object)
+        column[:] = list(values)
+        if len(column) and all(isinstance(value, (bool, int, float, np.number, np.bool_)) for value in column):
+            return np.asarray(column.tolist())
+        if len(column) and all(isinstance(value, str) for value in column):
+            return column.astype(str)
+        return column
+
+    def _values(self, column, by):
+        """
+        the values of column that aren't nan, with their group codes
+        """
+        groups, keys = self._groups(by)
+        values = np.asarray(self.columns[column], dtype=np.float64)
+        present = ~np.isnan(values)
+        return values[present], groups[present], keys
+
+    def _groups(self, by):
+        """
+        a group code for every row and the key of each group, groups ordered by key where the values can be sorted
+        """
+        by = StatsTable._by_columns(by)
+        groups = np.zeros(len(self), dtype=np.int64)
+        for column in by:
+            codes, number_of_values = StatsTable._factorize(self.columns[column])
+            groups = groups * number_of_values + codes
+            # renumbered after every column so the codes stay small however many columns are grouped on
+            _, groups = np.unique(groups, return_inverse=True)
+            groups = groups.reshape(-1)
+        if not by:
+            return groups, [()] if len(self) else []
+        _, first_rows = np.unique(groups, return_index=True)
+        keys = [tuple(StatsTable._plain(self.columns[column][row]) for column in by) for row in first_rows]
+        return groups, keys
+
+    @staticmethod
+    def _factorize(column):
+        try:
+            uniques, codes = np.unique(column, return_inverse=True)
+            return codes.reshape(-1), len(uniques)
+        except TypeError:
+            # values that can't be sorted against each other (e.g. None next to strings), numbered in order of appearance
+            codes = {}
+            return np.fromiter((codes.setdefault(value, len(codes)) for value in column), dtype=np.int64, count=len(column)), max(len(codes), 1)
+
+    @staticmethod
+    def _plain(value):
+        # group keys are plain python values, so they compare and print like the attribute values they come from
+        return value.item() if isinstance(value, np.generic) else value
+
+    @staticmethod
+    def _by_columns(by):
+        return (by,) if isinstance(by, str) else tuple(by)
+
+    @staticmethod
+    def _by_group(keys, values, by):
+        by = StatsTable._by_columns(by)
+        if not by:
+            return values[0] if len(values) else np.nan
+        return { key[0] if len(by) == 1 else key: value for key, value in zip(keys, values) }
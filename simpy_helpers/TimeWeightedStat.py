@@ -0,0 +1,36 @@
+class TimeWeightedStat:
+    """
+    Running time-integral of a piecewise constant quantity (queue length, number being processed, container level).
+    Each update is O(1), so exact time averages are available without keeping or resampling any event history.
+    """
+    def __init__(self, time, value=0):
+        self.start_time = time
+        self.last_time = time
+        self.last_value = value
+        self.integral = 0
+        self.minimum = value
+        self.maximum = value
+
+    def update(self, time, value):
+        self.integral += self.last_value * (time - self.last_time)
+        self.last_time = time
+        self.last_value = value
+        if value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+
+    def integral_until(self, now):
+        """
+        area under the quantity from start_time until now
+        """
+        return self.integral + self.last_value * (now - self.last_time)
+
+    def mean(self, now):
+        """
+        exact time-weighted average of the quantity from start_time until now
+        """
+        elapsed = now - self.start_time
+        if elapsed <= 0:
+            return self.last_value
+        return self.integral_until(now) / elapsed
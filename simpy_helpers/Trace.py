@@ -0,0 +1,138 @@
+import json
+import numpy as np
+
+class Trace:
+    """
+    Structured tracing of entities moving through the simulation.
+    Call sites check Trace.ENABLED before doing anything, so tracing costs a single flag check when it is turned off.
+
+    Trace.configure(sink, level="debug", resources=None) turns tracing on:
+    - sink receives every event that passes the filters (see RingBufferSink, JsonLinesSink and PrintSink)
+    - level drops events below this level
+    - resources (optional) is a list of resource names. Events at other resources are dropped.
+    Source.start(debug=True) configures a PrintSink, which prints the same messages debug mode always has.
+    """
+    ENABLED = False
+    LEVELS = {
+        "debug": 10,
+        "info": 20,
+        "warning": 30
+    }
+    # kind -> (code, level)
+    KINDS = {
+        "arrive": (0, 20),
+        "request": (1, 10),
+        "start": (2, 10),
+        "release": (3, 10),
+        "dispose": (4, 20),
+        "already_released": (5, 30)
+    }
+    KIND_NAMES = {code: kind for kind, (code, _) in KINDS.items()}
+    sink = None
+    level = 10
+    resources = None
+
+    @staticmethod
+    def configure(sink, level="debug", resources=None):
+        if level not in Trace.LEVELS:
+            raise NotImplementedError(f"You must pick a level in the list {list(Trace.LEVELS)}")
+        Trace.sink = sink
+        Trace.level = Trace.LEVELS[level]
+        Trace.resources = set(resources) if resources is not None else None
+        Trace.ENABLED = True
+
+    @staticmethod
+    def disable():
+        Trace.ENABLED = False
+        if Trace.sink is not None:
+            Trace.sink.flush()
+        Trace.sink = None
+
+    @staticmethod
+    def event(time, kind, entity, resource=None):
+        code, level = Trace.KINDS[kind]
+        if level < Trace.level:
+            return
+        resource_name = resource.name if resource is not None else None
+        if resource_name is not None and Trace.resources is not None and resource_name not in Trace.resources:
+            return
+        Trace.sink.write(time, code, level, entity, resource_name)
+
+class RingBufferSink:
+    """
+    Keeps the last `capacity` events in preallocated arrays, nothing is allocated per event.
+    events() returns them (oldest first) as a NumPy structured array.
+    """
+    DTYPE = np.dtype([("time", np.float64), ("kind", np.int8), ("level", np.int8), ("entity_id", np.int64), ("resource", np.int32)])
+
+    def __init__(self, capacity=1000000):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=RingBufferSink.DTYPE)
+        self.resource_names = []
+        self._resource_codes = {None: -1}
+        self.count = 0
+
+    def write(self, time, kind, level, entity, resource_name):
+        if resource_name not in self._resource_codes:
+            self._resource_codes[resource_name] = len(self.resource_names)
+            self.resource_names.append(resource_name)
+        entity_id = entity.id if entity.id is not None else -1
+        self.buffer[self.count % self.capacity] = (time, kind, level, entity_id, self._resource_codes[resource_name])
+        self.count += 1
+
+    def flush(self):
+        pass
+
+    def events(self):
+        if self.count <= self.capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+class JsonLinesSink:
+    """
+    Writes one JSON object per event to a file, in batches of batch_size events.
+    Call Trace.disable() (or flush()) at the end of the run to write out the last batch.
+    """
+    def __init__(self, path, batch_size=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self._batch = []
+        open(self.path, "w").close()
+
+    def write(self, time, kind, level, entity, resource_name):
+        self._batch.append((time, kind, level, entity.name, entity.id, resource_name))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        with open(self.path, "a") as f:
+            f.writelines(
+                json.dumps({ "time": time, "kind": Trace.KIND_NAMES[kind], "level": level, "entity": name, "entity_id": entity_id, "resource": resource_name }, default=str) + "\n"
+                for time, kind, level, name, entity_id, resource_name in self._batch
+            )
+        self._batch = []
+
+class PrintSink:
+    """
+    Prints a human readable line per event, this is what debug mode uses.
+    """
+    def write(self, time, kind, level, entity, resource_name):
+        kind = Trace.KIND_NAMES[kind]
+        if kind == "arrive":
+            print(entity)
+        elif kind == "request":
+            print(f'{entity.name} requesting {resource_name}: {time}')
+        elif kind == "start":
+            print(f'{entity.name} started processing at {resource_name} : {time}')
+        elif kind == "release":
+            print(f'{entity.name} finished at {resource_name}: {time}')
+        elif kind == "already_released":
+            print(f"resource has already been released by {entity.name}")
+        elif kind == "dispose":
+            print(f"{entity.name} disposed: {time}")
+
+    def flush(self):
+        pass
@@ -1,4 +1,17 @@
 from .Entity import Entity
 from .Resource import Resource, Container
 from .Source import Source
-from .Stats import Stats
\ No newline at end of file
+from .Stats import Stats
+from .Table import StatsTable
+from .Profiler import Profiler
+from .EventLog import EventLog, CoalescingEventLog, DownsampledEventLog
+from .RandomStreams import RandomStreams, RandomStream
+from .Replications import Replications
+from .Experiment import Experiment
+from .OutputAnalysis import OutputAnalysis, RunController
+from .RunningStat import RunningStat
+from .Trace import Trace, RingBufferSink, JsonLinesSink, PrintSink
+from .Sampler import Sampler, CallbackSink, GeneratorSink, RotatingFileSink, SocketSink
+from .ResultStore import ResultStore
+from .Snapshot import StatsSnapshot
+from .Route import Route, Branch, ByAttribute, Rework
\ No newline at end of file